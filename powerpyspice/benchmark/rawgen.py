@@ -0,0 +1,151 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Deterministic generator for synthetic spice raw files"""
+
+import numpy
+
+
+def get_data_type(double=False, little_endian=False):
+    if double:
+        data_type = numpy.dtype('float64')
+    else:
+        data_type = numpy.dtype('float32')
+    if little_endian:
+        return data_type.newbyteorder('<')
+    return data_type.newbyteorder('>')
+
+
+def _write_header(raw, index, npoints, nvars, real, binary, dimensions):
+    if real:
+        plotname = "Transient Analysis"
+        scale = "time"
+    else:
+        plotname = "AC Analysis"
+        scale = "frequency"
+    raw.write("Title: powerpyspice benchmark plot %d\n" % index)
+    raw.write("Date: Thu Jan  1 00:00:00 1970\n")
+    raw.write("Plotname: %s\n" % plotname)
+    raw.write("Flags: %s\n" % ("real" if real else "complex"))
+    raw.write("No. Variables: %d\n" % nvars)
+    raw.write("No. Points: %d\n" % npoints)
+    if dimensions:
+        raw.write("Dimensions: %s\n" % ",".join(str(d) for d in dimensions))
+    raw.write("Variables:\n")
+    raw.write("\t0\t%s\t%s\n" % (scale, scale))
+    for n in xrange(1, nvars):
+        if n % 2:
+            raw.write("\t%d\tv(n%d)\tvoltage\n" % (n, n))
+        else:
+            raw.write("\t%d\ti(v%d)\tcurrent\n" % (n, n))
+    raw.write("Binary:\n" if binary else "Values:\n")
+
+
+def _make_block(rand, rows, nvars, real, start):
+    """
+    Create the next (rows, nvars) block of a plot, the scale being a
+    monotonic sequence with non uniform steps continuing from start
+    """
+    steps = rand.uniform(0.5, 1.5, rows) * 1e-9
+    scale = start + numpy.cumsum(steps)
+    freqs = 1e6 * numpy.arange(1, nvars)
+    data = numpy.sin(numpy.outer(scale, freqs) * 2 * numpy.pi)
+    data += rand.normal(0, 0.01, data.shape)
+    if real:
+        block = numpy.empty((rows, nvars))
+    else:
+        block = numpy.empty((rows, nvars), dtype=numpy.complex128)
+        data = data * numpy.exp(1j * numpy.outer(scale, freqs))
+    block[:, 0] = scale
+    block[:, 1:] = data
+    return block, scale[-1]
+
+
+def _write_values(raw, block, first, double):
+    if double:
+        number = "%.15e"
+    else:
+        number = "%.7e"
+    nvars = block.shape[1]
+    if numpy.iscomplexobj(block):
+        number = number + "," + number
+        flat = numpy.empty((block.shape[0], nvars * 2))
+        flat[:, 0::2] = block.real
+        flat[:, 1::2] = block.imag
+        block = flat
+    line = " %d\t" + number + "\n" + ("\t" + number + "\n") * (nvars - 1)
+    raw.write("".join(line % ((first + i,) + tuple(row))
+                      for i, row in enumerate(block)))
+
+
+def _iter_blocks(rand, npoints, nvars, real, chunk_points):
+    """
+    Yield the (first point, block) of the values of a plot
+    """
+    start = 0.0
+    for first in xrange(0, npoints, chunk_points):
+        rows = min(chunk_points, npoints - first)
+        block, start = _make_block(rand, rows, nvars, real, start)
+        yield first, block
+
+
+def get_values(npoints, nvars, nplots=1, real=True, seed=0,
+               chunk_points=65536):
+    """
+    returns the (npoints, nvars) values of every plot written by
+    write_raw() with the same arguments, before they are rounded to the
+    precision of the file
+    """
+    rand = numpy.random.RandomState(seed)
+    plots = []
+    for index in xrange(nplots):
+        blocks = [block for first, block in
+                  _iter_blocks(rand, npoints, nvars, real, chunk_points)]
+        plots.append(numpy.concatenate(blocks))
+    return plots
+
+
+def write_raw(filename, npoints, nvars, nplots=1, real=True, binary=True,
+              double=False, little_endian=False, seed=0,
+              chunk_points=65536, dimensions=None):
+    """
+    Write a synthetic raw file in the ngspice format.
+
+    The content only depends on the arguments, the same seed always gives
+    the same file. The values are generated in blocks of chunk_points, so
+    files much larger than memory can be written. dimensions, the sizes
+    of nested sweeps, are written in the headers of the plots.
+    """
+    rand = numpy.random.RandomState(seed)
+    data_type = get_data_type(double, little_endian)
+    with open(filename, "wb") as raw:
+        for index in xrange(nplots):
+            _write_header(raw, index, npoints, nvars, real, binary,
+                          dimensions)
+            for first, block in _iter_blocks(rand, npoints, nvars, real,
+                                             chunk_points):
+                rows = len(block)
+                if not binary:
+                    _write_values(raw, block, first, double)
+                elif real:
+                    raw.write(block.astype(data_type).tostring())
+                else:
+                    flat = numpy.empty((rows, nvars * 2), dtype=data_type)
+                    flat[:, 0::2] = block.real
+                    flat[:, 1::2] = block.imag
+                    raw.write(flat.tostring())
+            if not binary:
+                raw.write("\n")
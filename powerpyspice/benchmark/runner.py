@@ -0,0 +1,278 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Time and peak memory benchmarks of the raw file reader and hdf writer
+
+Every measurement runs in a fresh python process, so the peak resident
+memory it reports only covers that measurement. The results are appended
+to a json lines file and each new result is compared to the previous
+ones of the same benchmark to catch regressions.
+"""
+
+import itertools
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib.backends.backend_agg as backend_agg
+import matplotlib.figure
+from oslo.config import cfg
+
+from powerpyspice.benchmark import rawgen
+from powerpyspice import config
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import spice_to_hdf
+from powerpyspice import plot
+from powerpyspice import spice
+
+CONF = cfg.CONF
+
+bench_cli_opts = [
+    cfg.StrOpt('bench-dir',
+               default=os.path.join(tempfile.gettempdir(),
+                                    'powerpyspice-bench'),
+               help="Directory for the generated raw files and hdf files"),
+    cfg.StrOpt('bench-results',
+               default='power-bench.jsonl',
+               help="File the benchmark results are appended to"),
+    cfg.ListOpt('bench-sizes',
+                default=['1000', '100000', '1000000'],
+                help="Number of elements (points times variables) of the"
+                     " generated raw files, up to 100000000"),
+    cfg.ListOpt('bench-vars',
+                default=['10', '1000'],
+                help="Number of variables of the generated raw files"),
+    cfg.ListOpt('bench-formats',
+                default=['-'.join(f) for f in itertools.product(
+                    ('real', 'complex'), ('binary', 'ascii'),
+                    ('f4', 'f8'), ('be', 'le'))],
+                help="Raw file formats to benchmark, as"
+                     " <real|complex>-<binary|ascii>-<f4|f8>-<be|le>"),
+    cfg.StrOpt('bench-filter',
+               default=None,
+               help="Only run the benchmarks whose name matches this"
+                    " regular expression"),
+    cfg.FloatOpt('bench-threshold',
+                 default=1.25,
+                 help="Report a regression when a benchmark is slower or"
+                      " uses more memory than this factor times the median"
+                      " of its previous results"),
+]
+
+CONF.register_cli_opts(bench_cli_opts)
+
+BENCHMARKS = ['read', 'read-mmap', 'hdf', 'display']
+## differences below these are noise, not regressions
+NOISE_FLOOR = {'seconds': 0.05, 'peak_delta_kb': 1024}
+
+
+class BenchCase(object):
+    """
+    A synthetic raw file to run the benchmarks on
+    """
+    def __init__(self, elements, nvars, fmt):
+        self.nvars = nvars
+        self.npoints = max(elements // nvars, 1)
+        self.format = fmt
+        kind, layout, precision, order = fmt.split('-')
+        self.real = kind == 'real'
+        self.binary = layout == 'binary'
+        self.double = precision == 'f8'
+        self.little_endian = order == 'le'
+
+    def get_name(self):
+        return "%s-%dx%d" % (self.format, self.npoints, self.nvars)
+
+    def get_rawfile(self):
+        """
+        Generate the raw file of the case, unless it already exists
+        """
+        filename = os.path.join(CONF.bench_dir, self.get_name() + ".raw")
+        if not os.path.exists(filename):
+            rawgen.write_raw(filename + ".part", self.npoints, self.nvars,
+                             real=self.real, binary=self.binary,
+                             double=self.double,
+                             little_endian=self.little_endian)
+            os.rename(filename + ".part", filename)
+        return filename
+
+
+def get_cases():
+    cases = []
+    for elements in CONF.bench_sizes:
+        for nvars in CONF.bench_vars:
+            if int(nvars) > int(elements):
+                continue
+            for fmt in CONF.bench_formats:
+                cases.append(BenchCase(int(elements), int(nvars), fmt))
+    return cases
+
+
+def _get_rss_kb():
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize() // 1024
+
+
+def _touch(spice_plot):
+    # Make sure every value is actually read, memory mapped or not
+    spice_plot.get_scalevector().get_data().sum()
+    for vector in spice_plot.get_datavectors():
+        vector.get_data().sum()
+
+
+def _run_benchmark(bench, rawfile, hdffile):
+    if bench == 'read':
+        for spice_plot in spice.SpiceReader(rawfile, mmap=False).get_plots():
+            _touch(spice_plot)
+    elif bench == 'read-mmap':
+        for spice_plot in spice.SpiceReader(rawfile, mmap=True).get_plots():
+            _touch(spice_plot)
+    elif bench == 'hdf':
+        spice_to_hdf.HdfCreate(rawfile)
+    elif bench == 'display':
+        hdf_file = backend.open_file(hdffile, "r")
+        fig = matplotlib.figure.Figure()
+        canvas = backend_agg.FigureCanvasAgg(fig)
+        plot.display_plot(hdf_file, plots=hdf_file.keys(),
+                          ax=fig.add_subplot(111))
+        canvas.draw()
+        hdf_file.close()
+
+
+def _measure(argv):
+    """
+    Entry point of the child process, prints the result as json
+    """
+    bench, rawfile, hdffile, double, little_endian = argv
+    CONF([], project='power-pyspice')
+    CONF.set_override('double_precision', double == '1')
+    CONF.set_override('little_endian', little_endian == '1')
+    CONF.set_override('hdf_file', hdffile)
+    start_rss = _get_rss_kb()
+    start = time.time()
+    _run_benchmark(bench, rawfile, hdffile)
+    seconds = time.time() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print json.dumps({'seconds': seconds,
+                      'peak_rss_kb': peak_rss,
+                      'peak_delta_kb': max(peak_rss - start_rss, 0)})
+
+
+def measure(bench, case):
+    """
+    Run a benchmark on a case in a child process and return its result
+    """
+    rawfile = case.get_rawfile()
+    hdffile = os.path.join(CONF.bench_dir, case.get_name() + ".h5")
+    if bench == 'hdf' and os.path.exists(hdffile):
+        os.remove(hdffile)
+    elif bench == 'display' and not os.path.exists(hdffile):
+        measure('hdf', case)
+    child = subprocess.Popen([sys.executable, '-m', __name__, bench,
+                              rawfile, hdffile, str(int(case.double)),
+                              str(int(case.little_endian))],
+                             stdout=subprocess.PIPE)
+    output = child.communicate()[0]
+    if child.returncode:
+        # Killed, most likely for running out of memory
+        return {'error': "exit code %s" % child.returncode}
+    # The reader may print warnings before the result
+    return json.loads(output.splitlines()[-1])
+
+
+def load_results(filename):
+    results = []
+    if not os.path.exists(filename):
+        return results
+    with open(filename) as results_file:
+        for line in results_file:
+            if line.strip():
+                results.append(json.loads(line))
+    return results
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def check_regression(result, previous):
+    """
+    Compare a result with the previous results of the same benchmark.
+    Returns the list of the regressed metrics.
+    """
+    regressions = []
+    same = [r for r in previous
+            if r['name'] == result['name'] and 'error' not in r]
+    if not same or 'error' in result:
+        return regressions
+    for metric, floor in NOISE_FLOOR.items():
+        baseline = _median([r[metric] for r in same])
+        if (result[metric] > baseline * CONF.bench_threshold and
+                result[metric] - baseline > floor):
+            regressions.append("%s %.3g -> %.3g" % (metric, baseline,
+                                                    result[metric]))
+    return regressions
+
+
+def run():
+    """
+    Run all the selected benchmarks, append their results to the results
+    file and return the number of regressions found
+    """
+    if not os.path.isdir(CONF.bench_dir):
+        os.makedirs(CONF.bench_dir)
+    previous = load_results(CONF.bench_results)
+    pattern = None
+    if CONF.bench_filter:
+        pattern = re.compile(CONF.bench_filter)
+    failures = 0
+    with open(CONF.bench_results, "a") as results_file:
+        for case in get_cases():
+            for bench in BENCHMARKS:
+                name = "%s/%s" % (bench, case.get_name())
+                if pattern and not pattern.search(name):
+                    continue
+                result = measure(bench, case)
+                result.update({'name': name,
+                               'time': time.time(),
+                               'version': config.version_string()})
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+                if 'error' in result:
+                    print "%-50s ERROR %s" % (name, result['error'])
+                    failures += 1
+                    continue
+                regressions = check_regression(result, previous)
+                print "%-50s %10.4fs %10dkB %s" % (
+                    name, result['seconds'], result['peak_delta_kb'],
+                    "REGRESSION " + ", ".join(regressions)
+                    if regressions else "")
+                failures += len(regressions)
+    return failures
+
+
+if __name__ == '__main__':
+    _measure(sys.argv[1:])
@@ -14,14 +14,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import os
 import sys
 
-import h5py
 from oslo.config import cfg
 import pbr.version
 
 from powerpyspice import config
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import cache
 from powerpyspice.hdf import spice_to_hdf
 from powerpyspice import plot
 
@@ -40,17 +40,16 @@ def main():
         print(pbr.version.VersionInfo('powerpyspice'))
         return(0)
 
-    if CONF.spicefile:
+    if CONF.spicefile and cache.is_enabled():
+        h5file = cache.IngestCache().get_hdf_file(CONF.spicefile)
+    elif CONF.spicefile:
         # TODO(mtreinish) This will create a hdf file and then close it
         # however we will use it again right after creation so this should
         # be reworked so that it's not closed until plotting is finished
         hdf = spice_to_hdf.HdfCreate(CONF.spicefile)
         h5file = hdf.outfile
     else:
-        if CONF.hdf_out_dir:
-            h5file = os.path.join(CONF.hdf_out_dir, CONF.hdf_file)
-        else:
-            h5file = CONF.hdf_file
+        h5file = spice_to_hdf.get_hdf_path()
 
-    hdf_file = h5py.File(h5file, "r")
+    hdf_file = backend.open_file(h5file, "r")
     plot.display_plot(hdf_file)
@@ -0,0 +1,86 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import fnmatch
+import sys
+
+from oslo.config import cfg
+import pbr.version
+
+from powerpyspice import config
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import cache
+from powerpyspice.hdf import reader
+from powerpyspice.hdf import spice_to_hdf
+from powerpyspice.hdf import stats
+from powerpyspice import plot  # noqa
+
+CONF = cfg.CONF
+
+
+def _selected(name, patterns):
+    if not patterns:
+        return True
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def print_stats(hdf_file, plots=None, vectors=None):
+    """
+    Print the stats table of the plots of an hdf5 file, restricted to the
+    plots named in plots and to the vectors matching the glob patterns in
+    vectors
+    """
+    width = max(len(stat) for stat in stats.STATS) + 8
+    header = "%-24s" % "vector" + "".join("%*s" % (width, stat)
+                                          for stat in stats.STATS)
+    for name in sorted(hdf_file):
+        if plots and name not in plots:
+            continue
+        hdf_plot = reader.HdfPlot(hdf_file[name])
+        if not hdf_plot.has_stats():
+            print "%s: no stats, convert it again with --hdf-stats" % name
+            continue
+        print "%s (%s)" % (name, hdf_plot.group.attrs.get('name', ''))
+        print header
+        for row in hdf_plot.get_stats():
+            if not _selected(row['name'], vectors):
+                continue
+            print "%-24s" % row['name'] + "".join("%*g" % (width, row[stat])
+                                                  for stat in stats.STATS)
+        print
+
+
+def main():
+    """Parse the options and call the appropriate class/methods."""
+    try:
+        config.parse_args(sys.argv)
+    except cfg.ConfigFilesNotFoundError:
+        print("Could not read.")
+        return(2)
+
+    if not CONF.version:
+        print(pbr.version.VersionInfo('powerpyspice'))
+        return(0)
+
+    if CONF.spicefile and cache.is_enabled():
+        h5file = cache.IngestCache().get_hdf_file(CONF.spicefile)
+    elif CONF.spicefile:
+        h5file = spice_to_hdf.HdfCreate(CONF.spicefile).outfile
+    else:
+        h5file = spice_to_hdf.get_hdf_path()
+
+    with backend.open_file(h5file, "r") as hdf_file:
+        print_stats(hdf_file, CONF.plots, CONF.vectors)
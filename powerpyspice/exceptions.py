@@ -48,3 +48,19 @@ class PowerPySpiceException(Exception):
 
 class InvalidRawFile(PowerPySpiceException):
     message = "Unexpected data in rawfile:\n"
+
+
+class PlotExists(PowerPySpiceException):
+    message = ("A plot named %(name)s already exists in the hdf5 file, use"
+               " --overwrite to replace it")
+
+
+class DowncastError(PowerPySpiceException):
+    message = ("Downcasting %(name)s to %(dtype)s loses %(error)g of its peak"
+               " value, more than the --hdf-downcast-tolerance of"
+               " %(tolerance)g")
+
+
+class SwmrNotSupported(PowerPySpiceException):
+    message = ("%(filename)s can't be written in swmr mode, it was not"
+               " created with --hdf-swmr")
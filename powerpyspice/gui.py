@@ -14,12 +14,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
 import gtk
-import h5py
 import matplotlib.backends.backend_gtkagg as gtkagg
 import matplotlib.figure
 from oslo.config import cfg
 
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import cache
+from powerpyspice.hdf import npystore
+from powerpyspice.hdf import reader
 from powerpyspice.hdf import spice_to_hdf
 from powerpyspice import plot
 
@@ -79,6 +84,7 @@ class PyApp(gtk.Window):
         filter.set_name("Input file")
         filter.add_pattern("*.h5")
         filter.add_pattern("*.raw")
+        filter.add_pattern(npystore.MANIFEST)
         dialog.add_filter(filter)
         response = dialog.run()
         if response == gtk.RESPONSE_OK:
@@ -101,11 +107,7 @@ class PyApp(gtk.Window):
         self.plot_dict[label] = not self.plot_dict[label]
 
     def _get_vector_names(self, plot_name):
-        vector_names = []
-        for vector in self.hdf_file.get(plot_name).values():
-            if 'scale' not in vector.name:
-                vector_names.append(vector.attrs['name'])
-        return vector_names
+        return reader.HdfPlot(self.hdf_file.get(plot_name)).get_vector_names()
 
     def select_plots(self):
         plots = self._get_plots()
@@ -180,10 +182,16 @@ class PyApp(gtk.Window):
         if self.filename is None:
             self.on_warn("A filename must be chosen")
         if self.filename.endswith('.h5'):
-            return h5py.File(self.filename, "r")
+            return backend.open_file(self.filename, "r")
+        elif os.path.basename(self.filename) == npystore.MANIFEST:
+            # npy stores are opened by their manifest
+            return backend.open_file(os.path.dirname(self.filename), "r")
+        elif '.raw' in self.filename and cache.is_enabled():
+            h5file = cache.IngestCache().get_hdf_file(self.filename)
+            return backend.open_file(h5file, "r")
         elif '.raw' in self.filename:
             hdf = spice_to_hdf.HdfCreate(self.filename)
-            return h5py.File(hdf.outfile, "r")
+            return backend.open_file(hdf.outfile, "r")
         else:
             self.on_error("Unrecognized file extension for %s" % self.filename)
             return
@@ -0,0 +1,102 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Storage backends of the converted plots
+
+The plots are written and read through the h5py File/Group/Dataset API,
+by h5py itself for the "hdf5" backend or by powerpyspice.hdf.npystore for
+the "npy" backend, a directory of .npy files that many processes can map
+at once. open_file() opens either one.
+"""
+
+import os
+
+import h5py
+from oslo.config import cfg
+
+from powerpyspice.hdf import npystore
+
+CONF = cfg.CONF
+
+BACKEND_HDF5 = 'hdf5'
+BACKEND_NPY = 'npy'
+## suffix of the files of every backend in the ingest cache
+SUFFIXES = {BACKEND_HDF5: '.h5', BACKEND_NPY: '.npy'}
+## root attribute of the hdf5 files written in swmr mode
+SWMR_ATTR = 'swmr'
+
+backend_cli_opts = [
+    cfg.StrOpt('hdf-backend',
+               default=BACKEND_HDF5,
+               choices=[BACKEND_HDF5, BACKEND_NPY],
+               help="Storage of the converted plots, an hdf5 file or a"
+                    " directory of .npy files memory mapped when read"),
+]
+
+CONF.register_cli_opts(backend_cli_opts)
+
+
+def get_backend(path):
+    """
+    returns the backend of an existing file, the hdf-backend option for a
+    new one
+    """
+    if os.path.isdir(path):
+        return BACKEND_NPY
+    elif os.path.exists(path):
+        return BACKEND_HDF5
+    return CONF.hdf_backend
+
+
+def open_file(path, mode='r', backend=None, swmr=False):
+    """
+    Open the plots stored at path with the h5py File API. hdf5 files are
+    read in swmr mode, so they can be read while they are written with the
+    hdf-swmr option, and written in swmr mode if swmr is True, which needs
+    the latest file format.
+    """
+    if backend is None:
+        backend = get_backend(path)
+    if backend == BACKEND_NPY:
+        return npystore.NpyFile(path, mode)
+    if mode == 'r':
+        return h5py.File(path, mode, swmr=True)
+    elif swmr:
+        return h5py.File(path, mode, libver='latest')
+    return h5py.File(path, mode)
+
+
+def refresh(group):
+    """
+    Refresh the extents of the datasets of a group of an hdf5 file written
+    in swmr mode, to see the points written since it was opened. The
+    other files are left alone, their datasets never change and hdf5
+    fails to refresh them while they are open more than once.
+    """
+    if not isinstance(group, h5py.Group):
+        return
+    if not group.file.attrs.get(SWMR_ATTR, False):
+        return
+    # group.file does not know the swmr mode it was opened in
+    if not group.file.id.get_intent() & h5py.h5f.ACC_SWMR_READ:
+        return
+
+    def refresh_dataset(name, node):
+        if isinstance(node, h5py.Dataset):
+            node.refresh()
+    group.visititems(refresh_dataset)
+
+
+def is_dataset(node):
+    return isinstance(node, (h5py.Dataset, npystore.NpyDataset))
@@ -0,0 +1,77 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Block index of the scale of the plots of an hdf5 file
+
+The 'block_index' dataset of a plot holds the first and the last scale
+value of every block of consecutive points, a (nblocks, 2) table. The
+blocks are as long as the chunks of the datasets of the plot, given by
+the points attribute, so finding a scale value in a monotonic scale
+reads the index and one chunk of the scale. Complex scales are indexed
+by their real part. Nested sweeps have no block index, their scale is
+not monotonic.
+"""
+
+import numpy
+
+BLOCK_INDEX = 'block_index'
+
+
+class BlockIndexBuilder(object):
+    """
+    Write the block index of a plot, in the resizable (0, 2) dataset, from
+    the (rows, ncols) blocks of its points, the scale in the first column,
+    for blocks of points points. The index grows as the blocks are
+    completed, so it covers all but the last points of the plot while it
+    is written.
+    """
+    def __init__(self, dataset, points):
+        self.dataset = dataset
+        self.points = points
+        self.rows = 0
+        self.nblocks = 0
+        # The first and last scale values of the block being filled
+        self.first = None
+        self.last = None
+
+    def _write(self, entries):
+        end = self.nblocks + len(entries)
+        self.dataset.resize(end, axis=0)
+        self.dataset[self.nblocks:end] = entries
+        self.nblocks = end
+
+    def add_block(self, block):
+        scale = numpy.asarray(block[:, 0].real, dtype=numpy.float64)
+        if len(scale) == 0:
+            return
+        positions = numpy.arange(self.rows, self.rows + len(scale))
+        firsts = scale[positions % self.points == 0]
+        lasts = scale[(positions + 1) % self.points == 0]
+        if self.first is not None:
+            firsts = numpy.concatenate(([self.first], firsts))
+        if len(lasts):
+            self._write(numpy.column_stack((firsts[:len(lasts)], lasts)))
+        self.first = None
+        if len(firsts) > len(lasts):
+            self.first = firsts[-1]
+        self.last = scale[-1]
+        self.rows += len(scale)
+
+    def finish(self):
+        """
+        Write the last block, ended by the end of the points
+        """
+        if self.first is not None:
+            self._write([(self.first, self.last)])
+            self.first = None
@@ -0,0 +1,218 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cache of the hdf5 files converted from raw files
+
+Opening a raw file for plotting converts it to an hdf5 file once. The
+hdf5 file is kept in the cache directory under a key made of the size,
+the mtime and a hash of samples of the content of the raw file, of the
+version of the converter and of the options changing the conversion. A
+json file next to it records where it comes from. The least recently
+used files are evicted once the cache grows over its size limit. With
+the npy backend the cached files are npy stores, directories named
+after the key.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import spice_to_hdf
+
+CONF = cfg.CONF
+
+cache_cli_opts = [
+    cfg.BoolOpt('ingest-cache',
+                default=True,
+                help="Keep the hdf5 files converted from the raw files"
+                     " opened for plotting, so they are only converted"
+                     " once. The raw files are converted to the file given"
+                     " with --hdf-file or --hdf-out-dir instead"),
+    cfg.StrOpt('cache-dir',
+               default=os.path.join(os.path.expanduser('~'), '.cache',
+                                    'powerpyspice'),
+               help="Directory of the ingest cache"),
+    cfg.IntOpt('cache-size',
+               default=10240,
+               min=0,
+               help="Size in MiB the ingest cache is trimmed to, the least"
+                    " recently used files are removed first"),
+]
+
+CONF.register_cli_opts(cache_cli_opts)
+
+## bytes hashed at the start, the middle and the end of a raw file
+SAMPLE_SIZE = 1024 * 1024
+## options changing the hdf5 file converted from a raw file
+CONVERSION_OPTS = ['hdf_backend', 'little_endian', 'double_precision',
+                   'vectors', 'hdf_layout', 'hdf_chunk_points',
+                   'hdf_chunk_vectors', 'hdf_compression',
+                   'hdf_compression_level', 'hdf_shuffle', 'hdf_fletcher32',
+                   'hdf_pyramid', 'hdf_pyramid_factor', 'hdf_stats',
+                   'hdf_downcast', 'hdf_downcast_tolerance',
+                   'hdf_scale_encoding', 'hdf_scaleoffset']
+
+
+def is_enabled():
+    """
+    True if the raw files are converted through the cache, an output file
+    given with the hdf-file or hdf-out-dir options is written instead
+    """
+    return bool(CONF.ingest_cache and not CONF.hdf_file and
+                not CONF.hdf_out_dir)
+
+
+def hash_raw_file(filename):
+    """
+    returns a hash of the size and of samples of the content of a file,
+    fast whatever its size
+    """
+    size = os.path.getsize(filename)
+    digest = hashlib.sha1(str(size))
+    with open(filename, "rb") as raw_file:
+        for offset in (0, size // 2, size - SAMPLE_SIZE):
+            raw_file.seek(max(offset, 0))
+            digest.update(raw_file.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def _get_size(path):
+    """
+    returns the size of a file, or of the files of an npy store
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, dirs, names in os.walk(path) for name in names)
+
+
+class IngestCache(object):
+    """
+    The hdf5 files converted from raw files, in cache_dir (the cache-dir
+    option by default) and trimmed to max_size MiB (cache-size)
+    """
+    def __init__(self, cache_dir=None, max_size=None):
+        if cache_dir is None:
+            cache_dir = CONF.cache_dir
+        self.cache_dir = cache_dir
+        if max_size is None:
+            max_size = CONF.cache_size
+        self.max_size = max_size * 1024 * 1024
+
+    def get_options(self):
+        return dict((name, CONF[name]) for name in CONVERSION_OPTS)
+
+    def get_provenance(self, spice_file):
+        """
+        returns the provenance of the hdf5 file of a raw file
+        """
+        stat = os.stat(spice_file)
+        return {'source': os.path.abspath(spice_file),
+                'version': spice_to_hdf.FORMAT_VERSION,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'hash': hash_raw_file(spice_file),
+                'options': self.get_options()}
+
+    def get_key(self, provenance):
+        key = [provenance[name]
+               for name in ('version', 'hash', 'size', 'mtime')]
+        key.append(sorted(provenance['options'].items()))
+        return hashlib.sha1(json.dumps(key)).hexdigest()
+
+    def _get_path(self, key, suffix=None):
+        if suffix is None:
+            suffix = backend.SUFFIXES[CONF.hdf_backend]
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def lookup(self, spice_file):
+        """
+        returns the cached hdf5 file of a raw file or None
+        """
+        path = self._get_path(self.get_key(self.get_provenance(spice_file)))
+        if not os.path.exists(path):
+            return None
+        # The mtime of the hdf5 files orders them for eviction
+        os.utime(path, None)
+        return path
+
+    def get_hdf_file(self, spice_file):
+        """
+        returns the hdf5 file of a raw file, converted now unless it is
+        already in the cache
+        """
+        provenance = self.get_provenance(spice_file)
+        key = self.get_key(provenance)
+        path = self._get_path(key)
+        if os.path.exists(path):
+            os.utime(path, None)
+            return path
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # Converted in a directory of its own, so an interrupted conversion
+        # is never taken for a cached file and processes converting the
+        # same raw file don't write over each other
+        workdir = tempfile.mkdtemp(prefix=key, suffix=".part",
+                                   dir=self.cache_dir)
+        try:
+            partial = os.path.join(workdir, os.path.basename(path))
+            spice_to_hdf.HdfCreate(spice_file, outfile=partial)
+            provenance['created'] = time.time()
+            provenance_path = os.path.join(workdir, key + ".json")
+            with open(provenance_path, "w") as provenance_file:
+                json.dump(provenance, provenance_file)
+            os.rename(provenance_path, self._get_path(key, ".json"))
+            try:
+                os.rename(partial, path)
+            except OSError:
+                # An npy store can't replace the one of another process
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used hdf5 files until the cache fits in
+        its size limit, keep is never removed
+        """
+        entries = []
+        suffixes = tuple(backend.SUFFIXES.values())
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(suffixes):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            entries.append((os.stat(path).st_mtime, _get_size(path), path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            provenance = os.path.splitext(path)[0] + ".json"
+            if os.path.exists(provenance):
+                os.remove(provenance)
+            total -= size
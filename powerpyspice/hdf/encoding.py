@@ -0,0 +1,128 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Encodings of the vectors of the plots of the vectors layout
+
+The encoding attribute of a dataset tells how its values are stored:
+
+  * downcast: at a lower precision, float32 or float16 (complex64 for
+    complex vectors), the dtype attribute being the type they are read as
+  * delta: for a monotonic scale, as the differences to the previous
+    values, except the first value of every block of points values (the
+    points attribute) stored as is, so every block is decoded alone
+
+HdfPlot decodes them when the vectors are read.
+"""
+
+import numpy
+
+from powerpyspice import exceptions
+
+ENCODING_DOWNCAST = 'downcast'
+ENCODING_DELTA = 'delta'
+
+
+def get_downcast_type(value_type, downcast):
+    """
+    returns the type values of value_type are downcast to, complex values
+    can't be stored below complex64
+    """
+    if numpy.dtype(value_type).kind == 'c':
+        return numpy.dtype(numpy.complex64)
+    return numpy.dtype(downcast)
+
+
+class DowncastEncoder(object):
+    """
+    Downcast the values of a vector to dtype. finish() checks that the
+    error is at most tolerance times the peak magnitude of the vector,
+    once all its values are encoded, whatever blocks they came in.
+    """
+    encoding = ENCODING_DOWNCAST
+
+    def __init__(self, name, dtype, tolerance):
+        self.name = name
+        self.dtype = numpy.dtype(dtype)
+        self.tolerance = tolerance
+        self.error = 0.0
+        self.peak = 0.0
+
+    def encode(self, values):
+        with numpy.errstate(over='ignore', invalid='ignore'):
+            encoded = values.astype(self.dtype)
+            if not len(values):
+                return encoded
+            # A nan error, of an overflow or a nan value, is kept
+            self.error = numpy.max([self.error,
+                                    numpy.abs(encoded - values).max()])
+            self.peak = max(self.peak, numpy.abs(values).max())
+        return encoded
+
+    def finish(self):
+        if not self.error <= self.tolerance * self.peak:
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                error = numpy.float64(self.error) / self.peak
+            raise exceptions.DowncastError(name=self.name,
+                                           dtype=self.dtype.name,
+                                           error=error,
+                                           tolerance=self.tolerance)
+
+
+class DeltaEncoder(object):
+    """
+    Delta encode a scale written in consecutive blocks of values, with
+    the first value of every block of points values stored as is
+    """
+    encoding = ENCODING_DELTA
+
+    def __init__(self, points):
+        self.points = points
+        self.rows = 0
+        self.last = None
+
+    def encode(self, values):
+        if not len(values):
+            return values
+        previous = values[0] if self.last is None else self.last
+        deltas = numpy.diff(numpy.concatenate(([previous], values)))
+        positions = numpy.arange(self.rows, self.rows + len(values))
+        anchors = positions % self.points == 0
+        deltas[anchors] = values[anchors]
+        self.rows += len(values)
+        self.last = values[-1]
+        return deltas
+
+    def finish(self):
+        pass
+
+
+def finish_encoders(encoders):
+    """
+    Finish the encoders of the vectors of a plot once all the values are
+    encoded, None standing for a vector stored as it is
+    """
+    for encoder in encoders:
+        if encoder is not None:
+            encoder.finish()
+
+
+def decode_deltas(deltas, points):
+    """
+    returns the values of delta encoded values starting at the first value
+    of a block of points values
+    """
+    count = len(deltas)
+    padded = numpy.zeros(-(-count // points) * points, deltas.dtype)
+    padded[:count] = deltas
+    return padded.reshape(-1, points).cumsum(axis=1).ravel()[:count]
@@ -0,0 +1,405 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Directory store of .npy files
+
+A store is a directory with a 'manifest.json' file describing its tree of
+groups and datasets with their attributes. Every group is a directory and
+every dataset a .npy file, read with numpy.load(mmap_mode='r') so the
+processes reading a store share the page cache and the reads copy
+nothing.
+
+NpyFile, NpyGroup and NpyDataset have the subset of the h5py File, Group
+and Dataset API used by HdfWriter and HdfPlot, so they write and read
+stores as they do hdf5 files. The chunking and compression options of
+the datasets are ignored, the columns are stored raw. Datasets created
+empty grow along their first axis; their header is written when the
+store is flushed.
+"""
+
+import json
+import os
+import shutil
+import struct
+
+import numpy
+from numpy.lib import format as npy_format
+
+MANIFEST = 'manifest.json'
+STORE_FORMAT = 'powerpyspice-npy'
+STORE_VERSION = 1
+## npy headers are padded to this alignment
+HEADER_ALIGN = 64
+
+
+def is_store(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def _json_value(value):
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    elif isinstance(value, numpy.generic):
+        return value.item()
+    elif isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def _npy_header(shape, dtype, length=None):
+    """
+    returns the version 1.0 npy header of an array, padded to a length of
+    length bytes or to the header alignment
+    """
+    header = repr({'descr': npy_format.dtype_to_descr(dtype),
+                   'fortran_order': False,
+                   'shape': tuple(int(n) for n in shape)})
+    prefix = npy_format.magic(1, 0)
+    # the 2 bytes of the header length and the final newline
+    size = len(prefix) + 2 + len(header) + 1
+    if length is None:
+        length = -(-size // HEADER_ALIGN) * HEADER_ALIGN
+    header += ' ' * (length - size) + '\n'
+    return prefix + struct.pack('<H', len(header)) + header
+
+
+class NpyAttributes(object):
+    """
+    The attributes of a group or a dataset, stored in the manifest
+    """
+    def __init__(self, store, attrs):
+        self.store = store
+        self._attrs = attrs
+
+    def __getitem__(self, key):
+        return self._attrs[key]
+
+    def __setitem__(self, key, value):
+        self.store.check_writable()
+        self._attrs[key] = _json_value(value)
+
+    def __contains__(self, key):
+        return key in self._attrs
+
+    def __iter__(self):
+        return iter(self._attrs)
+
+    def get(self, key, default=None):
+        return self._attrs.get(key, default)
+
+    def keys(self):
+        return self._attrs.keys()
+
+    def items(self):
+        return self._attrs.items()
+
+
+class NpyNode(object):
+    def __init__(self, store, name, node):
+        self.store = store
+        self.name = name
+        self.node = node
+        self.attrs = NpyAttributes(store, node['attrs'])
+
+
+class NpyDataset(NpyNode):
+    """
+    A dataset of a store, a .npy file
+    """
+    def __init__(self, store, name, node):
+        super(NpyDataset, self).__init__(store, name, node)
+        self.path = os.path.join(store.path, node['file'])
+        self._array = None
+        self._file = None
+        self._resized = False
+        self.header_length = None
+        with open(self.path, 'rb') as npy_file:
+            if npy_format.read_magic(npy_file) == (1, 0):
+                header = npy_format.read_array_header_1_0(npy_file)
+            else:
+                header = npy_format.read_array_header_2_0(npy_file)
+            shape, fortran, dtype = header
+            self.header_length = npy_file.tell()
+        self.shape = shape
+        self.dtype = dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(numpy.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _get_row_size(self):
+        return self.dtype.itemsize * int(numpy.prod(self.shape[1:]))
+
+    def _load(self):
+        if self._array is None:
+            self.sync()
+            if 0 in self.shape:
+                # Empty files can't be mapped
+                self._array = numpy.empty(self.shape, self.dtype)
+            else:
+                self._array = numpy.load(self.path, mmap_mode='r')
+        return self._array
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def resize(self, size, axis=0):
+        """
+        Grow or shrink the dataset along its first axis, size is the new
+        length or the new shape
+        """
+        self.store.check_writable()
+        if isinstance(size, tuple):
+            shape = size
+        elif axis != 0:
+            raise ValueError("npy datasets only grow along their first axis")
+        else:
+            shape = (size,) + tuple(self.shape[1:])
+        if tuple(shape[1:]) != tuple(self.shape[1:]):
+            raise ValueError("npy datasets only grow along their first axis")
+        self._open()
+        self.shape = tuple(int(n) for n in shape)
+        self._resized = True
+        self._file.truncate(self.header_length +
+                            self.shape[0] * self._get_row_size())
+        self._array = None
+
+    def __setitem__(self, key, value):
+        """
+        Write consecutive rows, key is a slice of the first axis
+        """
+        self.store.check_writable()
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("npy datasets are written by slices of rows")
+        start, stop, step = key.indices(self.shape[0])
+        value = numpy.asarray(value, dtype=self.dtype)
+        value = numpy.broadcast_to(value, (max(stop - start, 0),) +
+                                   tuple(self.shape[1:]))
+        self._open()
+        self._file.seek(self.header_length + start * self._get_row_size())
+        self._file.write(numpy.ascontiguousarray(value).tostring())
+        self._array = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'r+b')
+            self.store.opened.append(self)
+
+    def sync(self):
+        """
+        Write the header of the current shape of a dataset being written
+        """
+        if self._file is None:
+            return
+        if self._resized:
+            self._file.seek(0)
+            self._file.write(_npy_header(self.shape, self.dtype,
+                                         self.header_length))
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
+
+
+class NpyGroup(NpyNode):
+    """
+    A group of a store, a directory
+    """
+    def _get_path(self, name):
+        return os.path.join(self.name, name).lstrip('/')
+
+    def _child(self, name):
+        if '/' in name.strip('/'):
+            first, rest = name.strip('/').split('/', 1)
+            return self._child(first)._child(rest)
+        node = self.node['children'][name]
+        path = '/'.join((self.name.rstrip('/'), name))
+        if node['type'] == 'group':
+            return NpyGroup(self.store, path, node)
+        return self.store.get_dataset(path, node)
+
+    def __getitem__(self, name):
+        try:
+            return self._child(name)
+        except KeyError:
+            raise KeyError("%s not found in %s" % (name, self.name))
+
+    def get(self, name, default=None):
+        try:
+            return self._child(name)
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.node['children'])
+
+    def keys(self):
+        return sorted(self.node['children'])
+
+    def values(self):
+        return [self._child(name) for name in self.keys()]
+
+    def items(self):
+        return [(name, self._child(name)) for name in self.keys()]
+
+    def _check_new(self, name):
+        self.store.check_writable()
+        if '/' in name or not name:
+            raise ValueError("Invalid name %r" % name)
+        if name in self.node['children']:
+            raise ValueError("%s already exists in %s" % (name, self.name))
+
+    def _add_child(self, name, node):
+        self.node['children'][name] = node
+        return self._child(name)
+
+    def create_group(self, name):
+        self._check_new(name)
+        path = self._get_path(name)
+        os.mkdir(os.path.join(self.store.path, path))
+        return self._add_child(name, {'type': 'group', 'attrs': {},
+                                      'children': {}})
+
+    def create_dataset(self, name, shape=None, dtype=None, data=None,
+                       **options):
+        """
+        Create a dataset from data, or an empty dataset of the given shape
+        and dtype. The storage options of h5py (chunks, maxshape,
+        compression...) are accepted and ignored.
+        """
+        self._check_new(name)
+        path = self._get_path(name) + '.npy'
+        filename = os.path.join(self.store.path, path)
+        if data is not None:
+            numpy.save(filename, numpy.ascontiguousarray(data))
+        else:
+            dtype = numpy.dtype(dtype)
+            # The header is sized for any length along the first axis
+            reserved = (2 ** 62,) + tuple(shape[1:])
+            length = len(_npy_header(reserved, dtype))
+            with open(filename, 'wb') as npy_file:
+                npy_file.write(_npy_header(shape, dtype, length))
+                npy_file.truncate(length + int(numpy.prod(shape)) *
+                                  dtype.itemsize)
+        return self._add_child(name, {'type': 'dataset', 'attrs': {},
+                                      'file': path})
+
+    def __delitem__(self, name):
+        self.store.check_writable()
+        node = self.node['children'].pop(name)
+        path = os.path.join(self.store.path, self._get_path(name))
+        prefix = '/'.join((self.name.rstrip('/'), name))
+        self.store.forget(prefix)
+        if node['type'] == 'group':
+            shutil.rmtree(path)
+        else:
+            os.remove(path + '.npy')
+
+
+class NpyFile(NpyGroup):
+    """
+    A store opened in mode 'r' (read only), 'a' (read and write, created
+    if missing) or 'w' (created, replacing an existing one)
+    """
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.filename = path
+        self.mode = mode
+        self.opened = []
+        self.datasets = {}
+        manifest = os.path.join(path, MANIFEST)
+        if mode == 'w' and os.path.exists(path):
+            shutil.rmtree(path)
+        if mode in ('a', 'w') and not os.path.exists(manifest):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.manifest = {'format': STORE_FORMAT,
+                             'version': STORE_VERSION,
+                             'root': {'type': 'group', 'attrs': {},
+                                      'children': {}}}
+            self._write_manifest()
+        elif mode in ('r', 'a'):
+            with open(manifest) as manifest_file:
+                self.manifest = json.load(manifest_file)
+            if self.manifest.get('format') != STORE_FORMAT:
+                raise IOError("%s is not an npy store" % path)
+        else:
+            raise ValueError("Invalid mode %s" % mode)
+        super(NpyFile, self).__init__(self, '/', self.manifest['root'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def check_writable(self):
+        if self.mode == 'r':
+            raise IOError("%s is opened read only" % self.path)
+
+    def get_dataset(self, name, node):
+        """
+        returns the dataset of the given path, datasets being written are
+        shared so their shape is the same for all
+        """
+        if name not in self.datasets:
+            self.datasets[name] = NpyDataset(self, name, node)
+        return self.datasets[name]
+
+    def forget(self, prefix):
+        for name in list(self.datasets):
+            if name == prefix or name.startswith(prefix + '/'):
+                dataset = self.datasets.pop(name)
+                dataset.close()
+                if dataset in self.opened:
+                    self.opened.remove(dataset)
+
+    def _write_manifest(self):
+        manifest = os.path.join(self.path, MANIFEST)
+        # Renamed over the old one so readers never see half a manifest
+        with open(manifest + '.tmp', 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file)
+        os.rename(manifest + '.tmp', manifest)
+
+    def flush(self):
+        if self.mode == 'r':
+            return
+        for dataset in self.opened:
+            dataset.sync()
+        self._write_manifest()
+
+    def close(self):
+        if self.mode != 'r':
+            self.flush()
+        for dataset in self.opened:
+            dataset.close()
+        self.opened = []
+        self.datasets = {}
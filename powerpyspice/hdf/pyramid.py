@@ -0,0 +1,157 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Multi-resolution min/max/mean pyramids of the plots of an hdf5 file
+
+The pyramid of a plot is stored in its 'pyramid' group. Level k is the
+'level-k' group, where every bin summarizes factor**k consecutive points
+(the decimation attribute of the level). A level holds a 'min', a 'max'
+and a 'mean' dataset of shape (nbins, nvars), the columns being the scale
+and the data vectors in the order of the plot, whatever its layout. The
+last bin of a level may cover fewer points. Complex vectors are reduced
+by their real part.
+
+The levels are built while the points are written, each one from the
+bins of the level below, so only a partial bin per level is held.
+"""
+
+import numpy
+
+PYRAMID_GROUP = 'pyramid'
+PYRAMID_STATS = ('min', 'max', 'mean')
+
+
+def get_decimations(npoints, factor):
+    """
+    returns the decimations of the levels of the pyramid of a plot of
+    npoints points, up to the last one with more than one bin
+    """
+    decimations = []
+    decimation = factor
+    while decimation < npoints:
+        decimations.append(decimation)
+        decimation *= factor
+    return decimations
+
+
+def _concat_bins(first, second):
+    return tuple(numpy.concatenate((a, b)) for a, b in zip(first, second))
+
+
+class PyramidLevel(object):
+    """
+    A level of a pyramid, written bin by bin as the level below grows
+
+    Bins are passed around as (mins, maxs, sums, counts) tuples, the
+    counts being the number of points of every bin.
+    """
+    def __init__(self, datasets, factor):
+        self.datasets = datasets
+        self.factor = factor
+        self.carry = None
+        self.nbins = 0
+
+    def _write(self, bins):
+        mins, maxs, sums, counts = bins
+        end = self.nbins + len(counts)
+        for dataset, values in zip(self.datasets,
+                                   (mins, maxs, sums / counts[:, None])):
+            dataset.resize(end, axis=0)
+            dataset[self.nbins:end] = values
+        self.nbins = end
+
+    def add(self, bins):
+        """
+        Add bins of the level below and return the completed bins of this
+        level, or None
+        """
+        if self.carry is not None:
+            bins = _concat_bins(self.carry, bins)
+        count = len(bins[3])
+        full = count // self.factor * self.factor
+        self.carry = None
+        if full < count:
+            self.carry = tuple(b[full:] for b in bins)
+        if full == 0:
+            return None
+        shaped = [b[:full].reshape((full // self.factor, self.factor) +
+                                   b.shape[1:]) for b in bins]
+        bins = (shaped[0].min(axis=1), shaped[1].max(axis=1),
+                shaped[2].sum(axis=1), shaped[3].sum(axis=1))
+        self._write(bins)
+        return bins
+
+    def flush(self):
+        """
+        Write the last, partial bin and return it, or None
+        """
+        if self.carry is None:
+            return None
+        mins, maxs, sums, counts = self.carry
+        bins = (mins.min(axis=0)[None], maxs.max(axis=0)[None],
+                sums.sum(axis=0)[None], counts.sum(axis=0)[None])
+        self.carry = None
+        self._write(bins)
+        return bins
+
+
+class PyramidBuilder(object):
+    """
+    Build the pyramid of a plot from the blocks of its points
+
+    writer is the HdfWriter creating the datasets, group the plot group,
+    ncols the number of columns of the blocks and value_type their dtype.
+    npoints, the number of points in the headers, sets the levels.
+    """
+    def __init__(self, writer, group, ncols, value_type, npoints, factor):
+        # Complex vectors are reduced by their real part
+        real_type = numpy.zeros(0, value_type).real.dtype.newbyteorder('=')
+        pyramid = group.create_group(PYRAMID_GROUP)
+        writer.set_attrs(pyramid, ('factor', factor))
+        self.levels = []
+        for k, decimation in enumerate(get_decimations(npoints, factor)):
+            level = pyramid.create_group('level-%d' % (k + 1))
+            writer.set_attrs(level, ('decimation', decimation))
+            nbins = -(-npoints // decimation)
+            datasets = [writer.create_resizable(level, stat, (0, ncols),
+                                                real_type, nbins)
+                        for stat in PYRAMID_STATS]
+            self.levels.append(PyramidLevel(datasets, factor))
+
+    def add_block(self, block):
+        """
+        Add a (rows, ncols) block of points
+        """
+        values = block.real
+        bins = (values, values, values.astype(numpy.float64),
+                numpy.ones(len(values)))
+        for level in self.levels:
+            bins = level.add(bins)
+            if bins is None:
+                break
+
+    def finish(self):
+        """
+        Write the partial bins left at the end of the points
+        """
+        bins = None
+        for level in self.levels:
+            completed = None
+            if bins is not None:
+                completed = level.add(bins)
+            last = level.flush()
+            if completed is not None and last is not None:
+                bins = _concat_bins(completed, last)
+            else:
+                bins = completed if completed is not None else last
@@ -0,0 +1,321 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read the plots of the hdf5 files written by spice_to_hdf
+
+Two layouts are written. The "vectors" layout stores every vector as its
+own dataset, a 'scale' dataset and one 'data_vector-N' dataset per data
+vector, with the vector names and types as attributes. The "matrix"
+layout stores a plot as one (npoints, nvars) 'values' dataset with the
+scale in the first column, and the names and types of its columns in a
+compact 'vectors' index dataset. HdfPlot hides the difference, and reads
+hdf5 files and npy stores alike, see powerpyspice.hdf.backend.
+
+Plots may also have a min/max/mean pyramid, see powerpyspice.hdf.pyramid,
+which HdfPlot.get_decimated() reads to get a window of a plot at a
+resolution fitting a point budget, and a 'stats' table of the summary
+statistics of its vectors, see powerpyspice.hdf.stats, which
+HdfPlot.get_stats() reads. The block index of the scale, see
+powerpyspice.hdf.blockindex, lets HdfPlot.get_window() and read_window()
+read the points between two scale values without reading the whole
+scale.
+
+The vectors of the vectors layout may be stored encoded, see
+powerpyspice.hdf.encoding, HdfPlot decodes them as they are read.
+"""
+
+import numpy
+
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import blockindex
+from powerpyspice.hdf import encoding
+from powerpyspice.hdf import pyramid
+from powerpyspice.hdf import stats
+
+LAYOUT_VECTORS = 'vectors'
+LAYOUT_MATRIX = 'matrix'
+
+
+def get_layout(group):
+    """
+    returns the layout of a plot group, groups written before the layout
+    attribute existed use the vectors layout
+    """
+    return group.attrs.get('layout', LAYOUT_VECTORS)
+
+
+class DecimatedVectors(object):
+    """
+    Vectors read at the resolution of a pyramid level. scale has one
+    point per bin, the mean of the scale over the bin, and minimum,
+    maximum and mean map the vector names to the min, max and mean of
+    every bin. With a decimation of 1 they are the points themselves.
+    """
+    def __init__(self, decimation, scale, minimum, maximum, mean):
+        self.decimation = decimation
+        self.scale = scale
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = mean
+
+
+class HdfPlot(object):
+    """
+    A plot of an hdf5 file, read by vector name whatever its layout
+    """
+    def __init__(self, group):
+        self.group = group
+        self.layout = get_layout(group)
+        self.dimensions = None
+        if 'dimensions' in group.attrs:
+            self.dimensions = tuple(group.attrs['dimensions'])
+        self._names = None
+        self._types = None
+        self._index = None
+        self._positions = None
+
+    def refresh(self):
+        """
+        See the points written since the file was opened, for a file
+        written in swmr mode. hdf5 mixes up the chunks of a dataset
+        refreshed while it is open more than once, so no other HdfPlot of
+        the group may be reading it.
+        """
+        backend.refresh(self.group)
+
+    def is_matrix(self):
+        return self.layout == LAYOUT_MATRIX
+
+    def _load_index(self):
+        """
+        Map the vector names to their column or dataset. The scale comes
+        first, then the data vectors in the order of the raw file.
+        """
+        if self._index is not None:
+            return
+        if self.is_matrix():
+            vectors = self.group['vectors'][...]
+            self._names = list(vectors['name'])
+            self._types = list(vectors['type'])
+            self._index = dict((name, n)
+                               for n, name in enumerate(self._names))
+            self._positions = self._index
+            return
+        datasets = []
+        scale = None
+        for dataset in self.group.values():
+            if (not backend.is_dataset(dataset) or
+                    dataset.name.endswith('/' + stats.STATS_TABLE) or
+                    dataset.name.endswith('/' + blockindex.BLOCK_INDEX)):
+                continue
+            elif dataset.name.endswith('/scale'):
+                scale = dataset
+            else:
+                datasets.append((dataset.attrs['id'], dataset))
+        if scale is None:
+            raise KeyError("No scale vector in %s" % self.group.name)
+        datasets = [scale] + [dataset for vid, dataset in sorted(datasets)]
+        self._names = [dataset.attrs['name'] for dataset in datasets]
+        self._types = [dataset.attrs['vtype'] for dataset in datasets]
+        self._index = dict(zip(self._names, datasets))
+        self._positions = dict((name, n)
+                               for n, name in enumerate(self._names))
+
+    def get_scale_name(self):
+        self._load_index()
+        return self._names[0]
+
+    def get_vector_names(self):
+        """
+        returns the names of the data vectors
+        """
+        self._load_index()
+        return self._names[1:]
+
+    def get_vector_type(self, name):
+        self._load_index()
+        return self._types[self._names.index(name)]
+
+    def get_column(self, name):
+        """
+        returns the column of a vector in the values dataset of a plot of
+        the matrix layout
+        """
+        self._load_index()
+        return self._index[name]
+
+    def _reshape(self, data):
+        # Nested sweeps are stored flat, older files stored them N-D
+        if self.dimensions and data.ndim == 1:
+            return data.reshape(self.dimensions)
+        return data
+
+    def get_vector(self, name, selection=Ellipsis):
+        """
+        Read a vector, or the points of a vector given by selection, a
+        slice of its flat index
+        """
+        self._load_index()
+        if not self.is_matrix():
+            dataset = self._index[name]
+            if selection is Ellipsis:
+                return self._reshape(self._read(dataset))
+            if dataset.ndim == 1:
+                return self._read(dataset, selection)
+            return self._read(dataset).ravel()[selection]
+        data = self.group['values'][selection, self._index[name]]
+        if selection is Ellipsis:
+            return self._reshape(data)
+        return data
+
+    def _read(self, dataset, selection=Ellipsis):
+        """
+        Read and decode the values of a dataset of the vectors layout
+        """
+        method = dataset.attrs.get('encoding')
+        if method == encoding.ENCODING_DELTA:
+            start, stop = 0, dataset.shape[0]
+            if selection is not Ellipsis:
+                start, stop = selection.indices(dataset.shape[0])[:2]
+            # The deltas are decoded from the start of their block
+            points = dataset.attrs['points']
+            begin = start // points * points
+            deltas = dataset[begin:max(stop, begin)]
+            return encoding.decode_deltas(deltas, points)[start - begin:]
+        data = dataset[selection]
+        if method == encoding.ENCODING_DOWNCAST:
+            data = data.astype(dataset.attrs['dtype'])
+        return data
+
+    def get_scale(self, selection=Ellipsis):
+        return self.get_vector(self.get_scale_name(), selection)
+
+    def get_npoints(self):
+        if self.is_matrix():
+            return self.group['values'].shape[0]
+        return self.group['scale'].size
+
+    def get_levels(self):
+        """
+        returns the (decimation, level group) of the levels of the pyramid
+        of the plot, finest first
+        """
+        if pyramid.PYRAMID_GROUP not in self.group:
+            return []
+        levels = [(level.attrs['decimation'], level) for level in
+                  self.group[pyramid.PYRAMID_GROUP].values()]
+        return sorted(levels, key=lambda level: level[0])
+
+    def find_point(self, t, side='left'):
+        """
+        returns the index of the first point of the scale at or after t,
+        or after t for side='right', for an increasing scale. The search
+        goes through the block index, or down the pyramid levels, so only
+        one chunk of the scale is read.
+        """
+        levels = self.get_levels()
+        start, stop = 0, None
+        if blockindex.BLOCK_INDEX in self.group:
+            index = self.group[blockindex.BLOCK_INDEX]
+            block = numpy.searchsorted(index[:, 1], t, side=side)
+            points = index.attrs['points']
+            start, stop = block * points, (block + 1) * points
+        elif levels:
+            factor = self.group[pyramid.PYRAMID_GROUP].attrs['factor']
+            for decimation, level in reversed(levels):
+                maxs = level['max'][start:stop, 0]
+                start += numpy.searchsorted(maxs, t, side=side)
+                start, stop = start * factor, (start + 1) * factor
+        scale = self.get_scale(slice(start, stop)).real
+        return min(start + numpy.searchsorted(scale, t, side=side),
+                   self.get_npoints())
+
+    def find_window(self, t0=None, t1=None):
+        """
+        returns the (start, stop) indexes of the points between the scale
+        values t0 and t1, from the start and to the end by default
+        """
+        start = 0
+        stop = self.get_npoints()
+        if t0 is not None:
+            start = self.find_point(t0)
+        if t1 is not None:
+            stop = self.find_point(t1, side='right')
+        return start, max(start, stop)
+
+    def get_window(self, names, t0=None, t1=None):
+        """
+        Read the points of vectors between the scale values t0 and t1
+        (from the start and to the end by default), for an increasing
+        scale. Returns the scale of the window and a dict of the vectors.
+        """
+        window = slice(*self.find_window(t0, t1))
+        return (self.get_scale(window),
+                dict((name, self.get_vector(name, window))
+                     for name in names))
+
+    def get_decimated(self, names, budget, t0=None, t1=None):
+        """
+        Read vectors between the scale values t0 and t1 (the whole plot by
+        default) with at most budget points, from the finest pyramid level
+        that fits. Returns a DecimatedVectors. Without a pyramid, or when
+        the window fits the budget, the points are read as they are.
+        """
+        self._load_index()
+        start, stop = self.find_window(t0, t1)
+        count = stop - start
+        selected = (1, None)
+        for decimation, level in [(1, None)] + self.get_levels():
+            selected = (decimation, level)
+            if -(-count // decimation) <= budget:
+                break
+        decimation, level = selected
+        if level is None:
+            window = slice(start, stop)
+            vectors = dict((name, self.get_vector(name, window))
+                           for name in names)
+            return DecimatedVectors(1, self.get_scale(window), vectors,
+                                    vectors, vectors)
+        window = slice(start // decimation, -(-stop // decimation))
+        bins = []
+        for stat in pyramid.PYRAMID_STATS:
+            dataset = level[stat]
+            bins.append(dict((name,
+                              dataset[window, self._positions[name]])
+                             for name in names))
+        scale = level['mean'][window, 0]
+        return DecimatedVectors(decimation, scale, *bins)
+
+    def has_stats(self):
+        return stats.STATS_TABLE in self.group
+
+    def get_stats(self, name=None):
+        """
+        returns the statistics of a data vector as a dict, or of all the
+        data vectors as a table with one row per vector, see
+        powerpyspice.hdf.stats. Only the stats table is read.
+        """
+        table = self.group[stats.STATS_TABLE][...]
+        if name is None:
+            return table
+        row = table[list(table['name']).index(name)]
+        return dict((stat, float(row[stat])) for stat in stats.STATS)
+
+
+def read_window(h5file, plot, vectors, t0=None, t1=None):
+    """
+    Read the points of the vectors of a plot of an hdf5 file between the
+    scale values t0 and t1, see HdfPlot.get_window()
+    """
+    return HdfPlot(h5file[plot]).get_window(vectors, t0, t1)
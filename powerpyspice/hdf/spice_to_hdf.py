@@ -15,14 +15,30 @@
 #    under the License.
 
 import os
+import Queue
+import sys
+import threading
+import time
 
-import h5py
+import numpy
 from oslo.config import cfg
 
+from powerpyspice import exceptions
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import blockindex
+from powerpyspice.hdf import encoding
+from powerpyspice.hdf import pyramid
+from powerpyspice.hdf import reader
+from powerpyspice.hdf import stats
 from powerpyspice import spice
 
 CONF = cfg.CONF
 
+DEFAULT_HDF_FILE = 'spice.h5'
+## version of the files HdfWriter writes, bumped whenever they change so
+## the ingest cache converts the raw files again
+FORMAT_VERSION = 2
+
 hdf_cli_opts = [
     cfg.StrOpt('hdf-out-dir',
                short='d',
@@ -31,8 +47,9 @@ hdf_cli_opts = [
                " default it will be put in your working directory"),
     cfg.StrOpt('hdf-file',
                short='o',
-               default='spice.h5',
-               help="Filename for hdf file created from spice raw."),
+               default=None,
+               help="Filename for hdf file created from spice raw, %s by"
+                    " default." % DEFAULT_HDF_FILE),
     cfg.BoolOpt('overwrite',
                 default=False,
                 help="Overwrite plot if it already exists in the hdf5 file"),
@@ -41,61 +58,738 @@ hdf_cli_opts = [
                default="Spice Plots",
                help="Specify a title to use for the plots and the hdf"
                     " metadata"),
+    cfg.IntOpt('hdf-chunk-points',
+               default=32768,
+               min=1,
+               help="Number of points per chunk of the hdf5 datasets, a"
+                    " time window of a few vectors then only reads a few"
+                    " chunks"),
+    cfg.StrOpt('hdf-compression',
+               default='lzf',
+               choices=['none', 'gzip', 'lzf'],
+               help="Compression filter of the hdf5 datasets"),
+    cfg.IntOpt('hdf-compression-level',
+               default=4,
+               min=0,
+               max=9,
+               help="Level of the gzip compression"),
+    cfg.BoolOpt('hdf-shuffle',
+                default=True,
+                help="Apply the shuffle filter before compressing, which"
+                     " makes smooth waveforms compress much better"),
+    cfg.BoolOpt('hdf-fletcher32',
+                default=False,
+                help="Store a fletcher32 checksum of every chunk"),
+    cfg.StrOpt('hdf-downcast',
+               default='none',
+               choices=['none', 'float32', 'float16'],
+               help="Store the data vectors of the vectors layout at a"
+                    " lower precision, complex vectors as complex64. They"
+                    " are read back at their original precision"),
+    cfg.FloatOpt('hdf-downcast-tolerance',
+                 default=1e-3,
+                 help="Largest error of the downcast values relative to the"
+                      " peak magnitude of the vector, the conversion fails"
+                      " above it"),
+    cfg.StrOpt('hdf-scale-encoding',
+               default='none',
+               choices=['none', encoding.ENCODING_DELTA],
+               help="Store the real scale of the plots of one dimension of"
+                    " the vectors layout as the differences between its"
+                    " values, which compress better"),
+    cfg.IntOpt('hdf-scaleoffset',
+               default=None,
+               min=0,
+               help="Quantize the real data vectors of the vectors layout"
+                    " to this number of decimal digits with the hdf5"
+                    " scale-offset filter. Vectors downcast to float16"
+                    " are left as they are"),
+    cfg.StrOpt('hdf-layout',
+               default=reader.LAYOUT_VECTORS,
+               choices=[reader.LAYOUT_VECTORS, reader.LAYOUT_MATRIX],
+               help="Store every vector of a plot as its own dataset"
+                    " (vectors) or a plot as one (npoints, nvars) dataset"
+                    " with an index of the vector names (matrix), which is"
+                    " much faster for plots of many vectors"),
+    cfg.IntOpt('hdf-chunk-vectors',
+               default=8,
+               min=1,
+               help="Number of columns per chunk of the matrix layout"),
+    cfg.IntOpt('hdf-buffer-size',
+               default=64,
+               min=1,
+               help="Size in MiB of the blocks of values converted at once,"
+                    " which bounds the memory used by the conversion"),
+    cfg.BoolOpt('hdf-pyramid',
+                default=False,
+                help="Store a pyramid of decimated min/max/mean levels of"
+                     " the vectors of every plot, so large plots can be"
+                     " displayed without reading every point"),
+    cfg.IntOpt('hdf-pyramid-factor',
+               default=16,
+               min=2,
+               help="Number of points or bins of the level below summarized"
+                    " by every bin of a pyramid level"),
+    cfg.BoolOpt('hdf-stats',
+                default=True,
+                help="Store the min, max, mean, rms and time weighted"
+                     " average of every vector in a stats table of its"
+                     " plot"),
+    cfg.IntOpt('hdf-pipeline-depth',
+               default=2,
+               min=0,
+               help="Number of blocks of values decoded ahead by a reader"
+                    " thread while the previous ones are written, each"
+                    " taking up to hdf-buffer-size of memory, 0 to read and"
+                    " write in turns"),
+    cfg.BoolOpt('hdf-swmr',
+                default=False,
+                help="Write the hdf5 file in single writer multiple reader"
+                     " mode, so it can be plotted while it is converted."
+                     " The file must be new or written in this mode"),
+    cfg.FloatOpt('hdf-swmr-flush-interval',
+                 default=1.0,
+                 help="Seconds between the flushes of the points written"
+                      " in swmr mode, when they become visible to the"
+                      " readers"),
 ]
 
 CONF.register_cli_opts(hdf_cli_opts)
 
 
-class HdfCreate(object):
-    """Create hdf file from spice raw file
+def get_hdf_path():
+    """
+    returns the hdf5 file set by the hdf-out-dir and hdf-file options
+    """
+    hdf_file = CONF.hdf_file or DEFAULT_HDF_FILE
+    if CONF.hdf_out_dir:
+        return os.path.join(CONF.hdf_out_dir, hdf_file)
+    return hdf_file
 
-    This class is used to create or update an hdf5 file from a spice
-    raw file.
+
+_DONE = object()
+_ERROR = object()
+
+
+def iter_pipelined(iterable, depth):
     """
-    def __init__(self, spice_file):
-        self.spice_data = spice.SpiceReader(spice_file)
-        self.plots = self.spice_data.get_plots()
-        if CONF.hdf_out_dir:
-            self.outfile = os.path.join(CONF.hdf_out_dir, CONF.hdf_file)
+    Yield the items of iterable, produced ahead by a thread into a queue
+    of at most depth items. The producer waits while the queue is full.
+    An exception raised by the producer is raised again where the item it
+    failed to produce is expected, and the producer stops once the
+    consumer stops, whether it exhausted the items or failed.
+    """
+    if depth <= 0:
+        for item in iterable:
+            yield item
+        return
+    items = Queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((None, item)):
+                    return
+            put((_DONE, None))
+        except Exception:
+            put((_ERROR, sys.exc_info()))
+        finally:
+            # A generator can only be closed by the thread running it
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            # Waiting with a timeout keeps the wait interruptible
+            try:
+                kind, value = items.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            if kind is _DONE:
+                return
+            elif kind is _ERROR:
+                raise value[0], value[1], value[2]
+            yield value
+    finally:
+        stop.set()
+        producer.join()
+
+
+class HdfWriter(object):
+    """Write spice plots to an hdf5 file in one session
+
+    The hdf5 file is opened once when the session starts and the plots
+    are added to it through the same handle. Attributes are collected
+    while the datasets are written and set in one batch, then the file is
+    flushed and closed once when the session ends:
+
+        with HdfWriter(outfile) as writer:
+            for index, plot in enumerate(plots):
+                writer.insert_spiceplot(plot, index)
+
+    If overwrite is True (the overwrite option by default) a plot of the
+    same name already in the file is replaced, otherwise PlotExists is
+    raised. Plots of a name already given in the session, like the
+    transient analyses of one raw file, are named after their index.
+    layout is the layout of the plots (the hdf-layout option by default),
+    see powerpyspice.hdf.reader.
+
+    The datasets are chunked and filtered as set by the hdf-chunk-points,
+    hdf-compression, hdf-shuffle and hdf-fletcher32 options. With the
+    hdf-pyramid option a min/max/mean pyramid is written along every plot
+    of one dimension, see powerpyspice.hdf.pyramid. With the hdf-stats
+    option the statistics of the vectors are written in the stats table
+    of every plot, see powerpyspice.hdf.stats. Plots of one dimension
+    also get the block index of their scale, see
+    powerpyspice.hdf.blockindex. The hdf-downcast, hdf-scale-encoding and
+    hdf-scaleoffset options encode the vectors of the vectors layout, see
+    powerpyspice.hdf.encoding.
+
+    outfile is an hdf5 file or an npy store, as set by the hdf-backend
+    option when it does not exist yet, see powerpyspice.hdf.backend.
+
+    With swmr True (the hdf-swmr option by default) the hdf5 file is
+    written in single writer multiple reader mode: all the plots are
+    prepared with prepare_spiceplot(), then start_swmr() is called and
+    their points written with write_spiceplot().
+    """
+    unoriginal_plot_names = [
+        "plotname undefined",
+        "transient time domain plot",
+    ]
+
+    def __init__(self, outfile, overwrite=None, layout=None, swmr=None):
+        self.outfile = outfile
+        if overwrite is None:
+            overwrite = CONF.overwrite
+        self.overwrite = overwrite
+        if layout is None:
+            layout = CONF.hdf_layout
+        self.layout = layout
+        if swmr is None:
+            swmr = CONF.hdf_swmr
+        self.swmr = swmr
+        self.swmr_started = False
+        self.h5file = None
+        self.pending_attrs = []
+        # Names of the plot groups created in the session
+        self.plot_names = set()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        self.h5file = backend.open_file(self.outfile, "a", swmr=self.swmr)
+        # The plots added without swmr can't be refreshed
+        if not self.swmr and backend.SWMR_ATTR in self.h5file.attrs:
+            del self.h5file.attrs[backend.SWMR_ATTR]
+
+    def close(self):
+        if self.h5file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.h5file.close()
+            self.h5file = None
+
+    def flush(self):
+        """
+        Set the pending attributes and flush the file
+        """
+        for node, attrs in self.pending_attrs:
+            for key, value in attrs:
+                node.attrs[key] = value
+        self.pending_attrs = []
+        self.h5file.flush()
+
+    def set_attrs(self, node, *attrs):
+        """
+        Queue (key, value) attributes of a group or dataset, they are set
+        on the next flush
+        """
+        self.pending_attrs.append((node, attrs))
+
+    def get_chunks(self, shape):
+        """
+        returns the chunk shape of a dataset, hdf-chunk-points points
+        along the last axes
+        """
+        chunks = []
+        remaining = CONF.hdf_chunk_points
+        for length in reversed(shape):
+            chunk = max(min(length, remaining), 1)
+            chunks.insert(0, chunk)
+            remaining = max(remaining // chunk, 1)
+        return tuple(chunks)
+
+    def get_matrix_chunks(self, shape):
+        """
+        returns the chunk shape of a (npoints, nvars) values dataset, a
+        few columns wide so reading a vector reads few other ones
+        """
+        columns = min(shape[1], CONF.hdf_chunk_vectors)
+        rows = max(CONF.hdf_chunk_points // columns, 1)
+        return (min(shape[0], rows), columns)
+
+    def get_dataset_options(self, shape, chunks=None, scaleoffset=None):
+        """
+        returns the storage options of a dataset of the given shape,
+        quantized to scaleoffset decimal digits if set
+        """
+        if not shape or 0 in shape:
+            # Empty datasets can't be chunked
+            return {}
+        if chunks is None:
+            chunks = self.get_chunks(shape)
+        options = {'chunks': chunks,
+                   'fletcher32': CONF.hdf_fletcher32}
+        if scaleoffset is not None:
+            options['scaleoffset'] = scaleoffset
+        if CONF.hdf_compression == 'none':
+            return options
+        # Shuffling only helps the compression
+        options['shuffle'] = CONF.hdf_shuffle
+        options['compression'] = CONF.hdf_compression
+        if CONF.hdf_compression == 'gzip':
+            options['compression_opts'] = CONF.hdf_compression_level
+        return options
+
+    def create_dataset(self, group, name, data, chunks=None,
+                       scaleoffset=None):
+        return group.create_dataset(
+            name, data=data, **self.get_dataset_options(data.shape, chunks,
+                                                        scaleoffset))
+
+    def create_resizable(self, group, name, shape, dtype, npoints,
+                         chunks=None, scaleoffset=None):
+        """
+        Create an empty dataset of the given shape that grows along its
+        first axis, chunked for npoints points
+        """
+        expected = (max(npoints, 1),) + shape[1:]
+        if chunks is None:
+            chunks = self.get_chunks(expected)
+        return group.create_dataset(
+            name, shape=shape, dtype=dtype, maxshape=(None,) + shape[1:],
+            **self.get_dataset_options(expected, chunks, scaleoffset))
+
+    def get_plot_name(self, plot, index):
+        if plot.plotname in self.unoriginal_plot_names:
+            return "plot%s" % index
+        if plot.plotname in self.plot_names:
+            return "%s-%d" % (plot.plotname, index)
+        return plot.plotname
+
+    def create_plot_group(self, name):
+        if name in self.h5file:
+            # Only the plots of previous sessions are overwritten
+            if not self.overwrite or name in self.plot_names:
+                raise exceptions.PlotExists(name=name)
+            del self.h5file[name]
+        self.plot_names.add(name)
+        return self.h5file.create_group(name)
+
+    def create_plot(self, plot, index):
+        """
+        Create the group of a plot and its metadata
+        """
+        name = self.get_plot_name(plot, index)
+        group = self.create_plot_group(name)
+        group_attrs = [('id', index),
+                       ('title', name),
+                       ('date', plot.date),
+                       ('name', plot.plotname),
+                       ('plot_type', plot.plottype)]
+        if plot.dimensions:
+            group_attrs.append(('dimensions', plot.dimensions))
+        if self.layout == reader.LAYOUT_MATRIX:
+            group_attrs.append(('layout', self.layout))
+        self.set_attrs(group, *group_attrs)
+        return group
+
+    def create_pyramid(self, group, plot):
+        """
+        returns the PyramidBuilder of a plot, None if it gets no pyramid
+        """
+        if not CONF.hdf_pyramid or plot.dimensions:
+            # The points of nested sweeps are not consecutive in time
+            return None
+        ncols = 1 + len(plot.get_datavectors())
+        return pyramid.PyramidBuilder(self, group, ncols,
+                                      plot.section.get_value_type(),
+                                      plot.section.npoints,
+                                      CONF.hdf_pyramid_factor)
+
+    def create_stats(self, group, plot):
+        """
+        Create the stats table of a plot, all nan until the plot is
+        written, and return its StatsBuilder, None without the hdf-stats
+        option
+        """
+        if not CONF.hdf_stats:
+            return None
+        names = [vector.name or "" for vector in plot.get_datavectors()]
+        stats_builder = stats.StatsBuilder(names,
+                                           time_weighted=not plot.dimensions)
+        group.create_dataset(stats.STATS_TABLE,
+                             data=stats_builder.get_table())
+        return stats_builder
+
+    def create_block_index(self, group, plot):
+        """
+        Create the block index of a plot, for blocks as long as the chunks
+        of its datasets, and return its BlockIndexBuilder, None for nested
+        sweeps
+        """
+        if plot.dimensions:
+            return None
+        npoints = max(plot.section.npoints, 1)
+        if self.layout == reader.LAYOUT_MATRIX:
+            ncols = 1 + len(plot.get_datavectors())
+            points = self.get_matrix_chunks((npoints, ncols))[0]
         else:
-            self.outfile = CONF.hdf_file
+            points = self.get_chunks((npoints,))[0]
+        dataset = self.create_resizable(group, blockindex.BLOCK_INDEX, (0, 2),
+                                        numpy.float64, -(-npoints // points))
+        self.set_attrs(dataset, ('points', points))
+        return blockindex.BlockIndexBuilder(dataset, points)
+
+    def create_stream(self, group, plot, datasets=None, encoders=None):
+        return PlotStream(plot, group, datasets, encoders,
+                          self.create_pyramid(group, plot),
+                          self.create_stats(group, plot),
+                          self.create_block_index(group, plot))
+
+    def get_encoders(self, plot):
+        """
+        returns the encoders of the scale and of the data vectors of a plot
+        of the vectors layout, None for the vectors stored as they are, see
+        powerpyspice.hdf.encoding
+        """
+        value_type = plot.section.get_value_type()
+        encoders = [None]
+        if (CONF.hdf_scale_encoding == encoding.ENCODING_DELTA and
+                value_type.kind != 'c' and not plot.dimensions):
+            # The blocks of the deltas are the chunks of the scale
+            npoints = max(plot.section.npoints, 1)
+            encoders[0] = encoding.DeltaEncoder(self.get_chunks((npoints,))[0])
+        for vector in plot.get_datavectors():
+            encoder = None
+            if CONF.hdf_downcast != 'none':
+                encoder = encoding.DowncastEncoder(
+                    vector.name,
+                    encoding.get_downcast_type(value_type, CONF.hdf_downcast),
+                    CONF.hdf_downcast_tolerance)
+            encoders.append(encoder)
+        return encoders
+
+    def get_encoding_attrs(self, value_type, encoder):
+        if encoder is None:
+            return []
+        elif encoder.encoding == encoding.ENCODING_DOWNCAST:
+            return [('encoding', encoder.encoding),
+                    ('dtype', numpy.dtype(value_type).name)]
+        return [('encoding', encoder.encoding), ('points', encoder.points)]
 
-        for index, plot in enumerate(self.plots):
-            self.insert_spiceplot(plot, index)
+    def get_scaleoffset(self, dtype):
+        # The scale-offset filter only takes 4 and 8 byte real values
+        dtype = numpy.dtype(dtype)
+        if dtype.kind != 'f' or dtype.itemsize not in (4, 8):
+            return None
+        return CONF.hdf_scaleoffset
 
     def insert_spiceplot(self, plot, index):
-        ## Open the hdf5-file
-        h5file = h5py.File(self.outfile, "a")
-        unoriginal_plot_names = [
-            "plotname undefined",
-            "transient time domain plot",
-        ]
-        if plot.plotname in unoriginal_plot_names:
-            name = "plot%s" % index
-        else:
-            name = plot.plotname
-        # Create plot group and metadata
-        group = h5file.create_group(name)
-        group.attrs['id'] = index
-        group.attrs['title'] = name
-        group.attrs['date'] = plot.date
-        group.attrs['name'] = plot.plotname
-        group.attrs['plot_type'] = plot.plottype
+        group = self.create_plot(plot, index)
+        stream = self.create_stream(group, plot)
+        if stream.has_builders():
+            stream.add_block(self.get_matrix(plot))
+        stream.finish()
+        if self.layout == reader.LAYOUT_MATRIX:
+            self.insert_values(group, plot)
+            return
+        encoders = self.get_encoders(plot)
         # Create the scale dataset and populate metadata
         scale = plot.get_scalevector()
         scale_data = scale.get_data()
-        scale_dset = group.create_dataset('scale', data=scale_data)
-        scale_dset.attrs['name'] = scale.name
-        scale_dset.attrs['vtype'] = scale.type
-        scale_dset.attrs['vlength'] = len(scale_data)
+        scale_dset = self.create_dataset(group, 'scale',
+                                         self.encode(encoders[0], scale_data))
+        self.set_attrs(scale_dset,
+                       ('name', scale.name),
+                       ('vtype', scale.type),
+                       ('vlength', scale_data.size),
+                       *self.get_encoding_attrs(scale_data.dtype, encoders[0]))
         # Create the data groups, tables and arrays
         for subindex, vdata in enumerate(plot.get_datavectors()):
             vdata_array = vdata.get_data()
-            data_vector = group.create_dataset('data_vector-%s' % subindex,
-                                               data=vdata_array)
-            data_vector.attrs['id'] = subindex
-            data_vector.attrs['name'] = vdata.name
-            data_vector.attrs['vtype'] = vdata.type
-            data_vector.attrs['vlength'] = len(vdata_array)
-        h5file.flush()
-        h5file.close()
+            encoder = encoders[subindex + 1]
+            encoded = self.encode(encoder, vdata_array)
+            data_vector = self.create_dataset(
+                group, 'data_vector-%s' % subindex, encoded,
+                scaleoffset=self.get_scaleoffset(encoded.dtype))
+            self.set_attrs(data_vector,
+                           ('id', subindex),
+                           ('name', vdata.name),
+                           ('vtype', vdata.type),
+                           ('vlength', vdata_array.size),
+                           *self.get_encoding_attrs(vdata_array.dtype,
+                                                    encoder))
+        encoding.finish_encoders(encoders)
+
+    def encode(self, encoder, values):
+        if encoder is None:
+            return values
+        return encoder.encode(values)
+
+    def get_matrix(self, plot):
+        """
+        returns the (npoints, nvars) values of a plot, the scale first
+        """
+        vectors = [plot.get_scalevector()] + plot.get_datavectors()
+        values = plot.values
+        if (values is not None and values.ndim == 2 and
+                plot.columns == range(values.shape[1]) and
+                len(vectors) == values.shape[1]):
+            # The column store of the plot already is the matrix
+            return values
+        return numpy.column_stack([vector.get_data().ravel()
+                                   for vector in vectors])
+
+    def create_index(self, group, vectors):
+        """
+        Create the index of the names and types of the columns of a plot
+        of the matrix layout
+        """
+        names = [vector.name or "" for vector in vectors]
+        types = [vector.type or "" for vector in vectors]
+        index = numpy.empty(len(vectors), dtype=[
+            ('name', 'S%d' % max(max(len(name) for name in names), 1)),
+            ('type', 'S%d' % max(max(len(vtype) for vtype in types), 1))])
+        index['name'] = names
+        index['type'] = types
+        group.create_dataset('vectors', data=index)
+
+    def insert_values(self, group, plot):
+        """
+        Write a plot in the matrix layout, its values and the index of the
+        names and types of their columns
+        """
+        self.create_index(group, [plot.get_scalevector()] +
+                          plot.get_datavectors())
+        values = self.get_matrix(plot)
+        self.create_dataset(group, 'values', values,
+                            self.get_matrix_chunks(values.shape))
+
+    def get_block_points(self, plot):
+        """
+        returns the number of points of the blocks a plot is streamed in,
+        a block of all its vectors fits in hdf-buffer-size
+        """
+        row = (plot.section.get_value_type().itemsize *
+               (1 + len(plot.get_datavectors())))
+        return max(CONF.hdf_buffer_size * 1024 * 1024 // row, 1)
+
+    def prepare_spiceplot(self, plot, index):
+        """
+        Create the group of a plot returned by the scan() of a reader, with
+        its attributes and all its datasets, empty, and return its
+        PlotStream for write_spiceplot(). The vectors are given the length
+        in the headers. Nested sweeps are stored flat, with their
+        dimensions in the plot attributes.
+        """
+        group = self.create_plot(plot, index)
+        vectors = [plot.get_scalevector()] + plot.get_datavectors()
+        value_type = plot.section.get_value_type()
+        npoints = plot.section.npoints
+        if self.layout == reader.LAYOUT_MATRIX:
+            self.create_index(group, vectors)
+            shape = (0, len(vectors))
+            chunks = self.get_matrix_chunks((max(npoints, 1), len(vectors)))
+            datasets = [self.create_resizable(group, 'values', shape,
+                                              value_type, npoints, chunks)]
+            return self.create_stream(group, plot, datasets)
+        encoders = self.get_encoders(plot)
+        datasets = []
+        for subindex, (vector, encoder) in enumerate(zip(vectors,
+                                                         encoders)):
+            if subindex:
+                name = 'data_vector-%s' % (subindex - 1)
+                vector_attrs = [('id', subindex - 1)]
+            else:
+                name = 'scale'
+                vector_attrs = []
+            # Only downcast vectors change type
+            dtype = getattr(encoder, 'dtype', value_type)
+            if subindex:
+                scaleoffset = self.get_scaleoffset(dtype)
+            else:
+                scaleoffset = None
+            dataset = self.create_resizable(group, name, (0,), dtype,
+                                            npoints, scaleoffset=scaleoffset)
+            vector_attrs += [('name', vector.name),
+                             ('vtype', vector.type),
+                             ('vlength', npoints)]
+            vector_attrs += self.get_encoding_attrs(value_type, encoder)
+            self.set_attrs(dataset, *vector_attrs)
+            datasets.append(dataset)
+        return self.create_stream(group, plot, datasets, encoders)
+
+    def start_swmr(self):
+        """
+        Set the attributes and switch the file to swmr mode, once all the
+        plots are prepared. From then on no group, dataset or attribute is
+        created, and the points are flushed every hdf-swmr-flush-interval
+        seconds. npy stores are only flushed.
+        """
+        if not hasattr(self.h5file, 'swmr_mode'):
+            self.flush()
+            return
+        # Tells the readers to refresh the datasets
+        self.h5file.attrs[backend.SWMR_ATTR] = True
+        self.flush()
+        try:
+            self.h5file.swmr_mode = True
+        except ValueError:
+            raise exceptions.SwmrNotSupported(filename=self.outfile)
+        self.swmr_started = True
+
+    def write_spiceplot(self, spice_reader, stream, spice_file=None):
+        """
+        Write the points of a plot prepared by prepare_spiceplot() without
+        loading it. The datasets grow with every block of points read from
+        the raw file, so no more than hdf-buffer-size of values is held at
+        once. spice_file is a handle of the raw file shared by the plots,
+        see SpiceReader.iter_chunks().
+        """
+        plot = stream.plot
+        datasets = stream.datasets
+        last_flush = time.time()
+        # The next blocks are decoded while one is written
+        blocks = spice_reader.iter_chunks(plot, self.get_block_points(plot),
+                                          spice_file)
+        if self.layout != reader.LAYOUT_MATRIX:
+            # Gather and encode the columns in the reader thread, the
+            # writer then writes contiguous rows
+            blocks = ((block, [self.encode(encoder, column) for encoder, column
+                               in zip(stream.encoders,
+                                      numpy.ascontiguousarray(block.T))])
+                      for block in blocks)
+        else:
+            blocks = ((block, None) for block in blocks)
+        for block, columns in iter_pipelined(blocks,
+                                             CONF.hdf_pipeline_depth):
+            start = stream.rows
+            end = start + len(block)
+            if columns is None:
+                datasets[0].resize(end, axis=0)
+                datasets[0][start:end] = block
+            else:
+                for dataset, column in zip(datasets, columns):
+                    dataset.resize((end,))
+                    dataset[start:end] = column
+            stream.add_block(block)
+            if (self.swmr_started and time.time() - last_flush >
+                    CONF.hdf_swmr_flush_interval):
+                self.h5file.flush()
+                last_flush = time.time()
+        stream.finish()
+        if self.swmr_started:
+            self.h5file.flush()
+
+
+class PlotStream(object):
+    """
+    A plot being written: its group, its datasets growing along their
+    first axis with the encoders of their columns for the vectors layout,
+    and the builders of its pyramid, stats table and block
+    index, which are None when the plot has none. All of them are created
+    before any point is written.
+    """
+    def __init__(self, plot, group, datasets, encoders, pyramid_builder,
+                 stats_builder, index_builder):
+        self.plot = plot
+        self.group = group
+        self.datasets = datasets
+        self.encoders = encoders
+        self.pyramid_builder = pyramid_builder
+        self.stats_builder = stats_builder
+        self.index_builder = index_builder
+        self.rows = 0
+
+    def has_builders(self):
+        return (self.pyramid_builder is not None or
+                self.stats_builder is not None or
+                self.index_builder is not None)
+
+    def add_block(self, block):
+        """
+        Add a (rows, ncols) block of points, the scale first, once written
+        """
+        for builder in (self.pyramid_builder, self.stats_builder,
+                        self.index_builder):
+            if builder is not None:
+                builder.add_block(block)
+        self.rows += len(block)
+
+    def finish(self):
+        if self.encoders is not None:
+            encoding.finish_encoders(self.encoders)
+        if self.pyramid_builder is not None:
+            self.pyramid_builder.finish()
+        if self.stats_builder is not None:
+            self.group[stats.STATS_TABLE][:] = self.stats_builder.get_table()
+        if self.index_builder is not None:
+            self.index_builder.finish()
+
+
+class HdfCreate(object):
+    """Create hdf file from spice raw file
+
+    This class is used to create or update an hdf5 file from a spice
+    raw file.
+    """
+    def __init__(self, spice_file, outfile=None):
+        self.spice_data = spice.get_reader(spice_file, load=False)
+        if outfile is not None:
+            self.outfile = outfile
+        else:
+            self.outfile = get_hdf_path()
+
+        # The plots are streamed block by block, all of them in one
+        # session. Their datasets are all created first, so that in swmr
+        # mode the readers see them while the points are written.
+        with HdfWriter(self.outfile) as writer:
+            streams = [writer.prepare_spiceplot(plot, index) for index, plot
+                       in enumerate(self.spice_data.scan())]
+            if writer.swmr:
+                writer.start_swmr()
+            # The plots are read in one pass, compressed files are only
+            # decompressed once
+            raw_file = spice.open_raw(spice_file)
+            try:
+                for stream in streams:
+                    writer.write_spiceplot(self.spice_data, stream, raw_file)
+            finally:
+                raw_file.close()
+
+    def insert_spiceplot(self, plot, index):
+        with HdfWriter(self.outfile) as writer:
+            writer.insert_spiceplot(plot, index)
@@ -0,0 +1,115 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Summary statistics of the vectors of a plot
+
+The statistics are computed while the points are written and stored in
+the 'stats' table of the plot group, one row per data vector:
+
+  * min, max: the extremes of the vector
+  * argmin, argmax: the scale values where they are first reached
+  * mean, rms: over the points
+  * average: the time weighted average, the trapezoidal integral of the
+    vector over the scale divided by the span of the scale, which is what
+    matters for a non uniform scale
+
+Complex vectors are summarized by their real part. Nested sweeps have no
+time weighted average, their scale is not monotonic.
+"""
+
+import numpy
+
+STATS_TABLE = 'stats'
+STATS = ('min', 'max', 'argmin', 'argmax', 'mean', 'rms', 'average')
+
+
+class StatsBuilder(object):
+    """
+    Accumulate the statistics of the data vectors of a plot, named names,
+    from the (rows, ncols) blocks of its points, the scale in the first
+    column
+    """
+    def __init__(self, names, time_weighted=True):
+        self.names = names
+        nvectors = len(names)
+        self.time_weighted = time_weighted
+        self.count = 0
+        self.min = numpy.full(nvectors, numpy.nan)
+        self.max = numpy.full(nvectors, numpy.nan)
+        self.argmin = numpy.full(nvectors, numpy.nan)
+        self.argmax = numpy.full(nvectors, numpy.nan)
+        self.sum = numpy.zeros(nvectors)
+        self.sum_squares = numpy.zeros(nvectors)
+        self.integral = numpy.zeros(nvectors)
+        self.first = None
+        self.last = None
+
+    def _update_extreme(self, current, where, scale, data, reduce_arg,
+                        better):
+        index = reduce_arg(data, axis=0)
+        values = data[index, numpy.arange(data.shape[1])]
+        # The first point wins ties, nan is only kept until a number comes
+        with numpy.errstate(invalid='ignore'):
+            update = better(values, current) | numpy.isnan(current)
+        current[update] = values[update]
+        where[update] = scale[index[update]]
+
+    def add_block(self, block):
+        values = numpy.asarray(block.real, dtype=numpy.float64)
+        if len(values) == 0:
+            return
+        scale = values[:, 0]
+        data = values[:, 1:]
+        self._update_extreme(self.min, self.argmin, scale, data,
+                             numpy.argmin, numpy.less)
+        self._update_extreme(self.max, self.argmax, scale, data,
+                             numpy.argmax, numpy.greater)
+        self.sum += data.sum(axis=0)
+        self.sum_squares += numpy.square(data).sum(axis=0)
+        self.count += len(values)
+        if self.time_weighted:
+            if self.last is not None:
+                # The segment between this block and the previous one
+                values = numpy.vstack((self.last, values))
+            steps = numpy.diff(values[:, 0])
+            self.integral += (steps[:, None] *
+                              (values[1:, 1:] + values[:-1, 1:])).sum(
+                                  axis=0) / 2
+            if self.first is None:
+                self.first = values[0]
+            self.last = values[-1]
+
+    def get_table(self):
+        """
+        returns the statistics as a table with one row per data vector,
+        all nan before any point is added
+        """
+        names = self.names
+        table = numpy.empty(len(names), dtype=[
+            ('name', 'S%d' % max([len(name) for name in names] + [1]))] +
+            [(stat, numpy.float64) for stat in STATS])
+        table['name'] = names
+        for stat in STATS[:4]:
+            table[stat] = getattr(self, stat)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            table['mean'] = self.sum / self.count
+            table['rms'] = numpy.sqrt(self.sum_squares / self.count)
+            if not self.time_weighted or self.first is None:
+                table['average'] = numpy.nan
+            elif self.last[0] == self.first[0]:
+                table['average'] = table['mean']
+            else:
+                table['average'] = (self.integral /
+                                    (self.last[0] - self.first[0]))
+        return table
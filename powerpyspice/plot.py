@@ -18,8 +18,11 @@ import matplotlib.lines as lines
 import matplotlib.pyplot
 import matplotlib.text as mtext
 import matplotlib.transforms as mtransforms
+import numpy
 from oslo.config import cfg
 
+from powerpyspice.hdf import reader
+
 CONF = cfg.CONF
 
 
@@ -30,7 +33,18 @@ cli_opts = [cfg.StrOpt('renderer',
                  " output format of the plot. The default is png use agg."),
             cfg.MultiStrOpt('plots',
             short='p',
-            help="Name of plot to be plotted")]
+            help="Name of plot to be plotted"),
+            cfg.IntOpt('plot-points',
+            default=4000,
+            help="Maximum number of points drawn per vector, plots with"
+                 " more points are drawn from their min/max pyramid when"
+                 " they have one (see hdf-pyramid)"),
+            cfg.FloatOpt('plot-start',
+            help="Scale value the plots start at, only the points from"
+                 " there are read"),
+            cfg.FloatOpt('plot-end',
+            help="Scale value the plots end at, only the points up to"
+                 " there are read")]
 
 CONF.register_cli_opts(cli_opts)
 
@@ -75,25 +89,45 @@ class SpiceLine(lines.Line2D):
 def display_plot(hdf_file, plots=None, ax=None):
     if plots is None:
         plots = CONF.plots
+    if ax is None:
+        target = matplotlib.pyplot
+    else:
+        target = ax
     for plot in plots:
-        plot_to_graph = hdf_file.get(plot)
-        x = None
-        data_vectors = []
-        for vector in plot_to_graph.values():
-            if 'scale' in vector.name:
-                x = vector[:]
-            else:
-                data_vectors.append(vector)
-        if x is None:
+        plot_to_graph = reader.HdfPlot(hdf_file.get(plot))
+        # The file may still be written by a conversion in swmr mode
+        plot_to_graph.refresh()
+        try:
+            names = plot_to_graph.get_vector_names()
+        except KeyError:
             print "No scale vector was found in the hdf plot specified"
             exit(1)
-
-        for vector in data_vectors:
-            y = vector[:]
-            if ax is None:
-                matplotlib.pyplot.plot(x, y, label=vector.attrs['name'])
+        if plot_to_graph.dimensions:
+            # Nested sweeps get one line per sweep along the last dimension
+            decimated = None
+            x = plot_to_graph.get_scale()
+            x = x.reshape(-1, x.shape[-1]).T
+        else:
+            # Large plots are drawn from their pyramid, as the envelope of
+            # the min and max of every bin around the mean
+            decimated = plot_to_graph.get_decimated(names, CONF.plot_points,
+                                                    CONF.plot_start,
+                                                    CONF.plot_end)
+            x = decimated.scale
+        # The scale of an ac plot is stored as complex
+        if numpy.iscomplexobj(x):
+            x = x.real
+
+        for name in names:
+            if decimated is None:
+                y = plot_to_graph.get_vector(name)
+                y = y.reshape(-1, y.shape[-1]).T
             else:
-                ax.plot(x, y, label=vector.attrs['name'])
+                y = decimated.mean[name]
+                if decimated.decimation > 1:
+                    target.fill_between(x, decimated.minimum[name],
+                                        decimated.maximum[name], alpha=0.3)
+            target.plot(x, y, label=name)
     if ax is None:
         matplotlib.pyplot.legend()
         matplotlib.pyplot.show()
@@ -16,6 +16,15 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bz2
+import fnmatch
+import gzip
+import json
+import operator
+import os
+import re
+import time
+
 import numpy
 import string
 
@@ -23,23 +32,88 @@ from oslo.config import cfg
 
 from powerpyspice import exceptions
 
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
 spice_file_opts = [
     cfg.BoolOpt('little-endian',
-                default=False,
+                default=None,
                 help="Specify whether the system used to generate the"
-                "waveforms used little-endian"),
+                " waveforms used little-endian, detected for each raw file"
+                " when not set"),
     cfg.BoolOpt('double-precision',
+                default=None,
+                help="Specify whether the spice raw files use double"
+                " precision floats, detected for each raw file when not"
+                " set"),
+    cfg.BoolOpt('mmap',
                 default=False,
-                help="Specify whether the spice raw files using double"
-                "recesion floats"),
+                help="Memory map the binary sections of the spice raw files"
+                     " instead of reading them into memory"),
+    cfg.BoolOpt('raw-index',
+                default=True,
+                help="Keep a sidecar index of the plots and the location of"
+                     " their values next to the spice raw files"),
+    cfg.MultiStrOpt('vectors',
+                    help="Name or glob pattern of the vectors to load from"
+                         " the spice raw files, all vectors are loaded by"
+                         " default"),
     cfg.StrOpt('spicefile',
                short='i',
                help="The input spice raw files to be read in for "
-                    "plotting"),
+                    "plotting, gzip, bz2 and xz compressed files are "
+                    "decompressed while they are read"),
 ]
 CONF = cfg.CONF
 CONF.register_cli_opts(spice_file_opts)
 
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 2
+## bytes read per poll when following a raw file that is being written
+FOLLOW_READ_SIZE = 16 * 1024 * 1024
+## magic bytes of the compressed raw files that are decoded as a stream
+COMPRESSION_MAGIC = [('gzip', "\x1f\x8b"), ('bz2', "BZh"),
+                     ('xz', "\xfd7zXZ\x00")]
+## points of the first binary section used to detect the dtype of a file
+DETECT_POINTS = 64
+
+
+def get_compression(filename):
+    """
+    returns the compression of a raw file, gzip, bz2 or xz, or None for an
+    uncompressed file
+    """
+    with open(filename, "rb") as raw_file:
+        magic = raw_file.read(6)
+    for compression, prefix in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            return compression
+    return None
+
+
+def open_raw(filename):
+    """
+    Open a raw file for reading. Compressed files are decompressed as a
+    stream while they are read, the offsets are then the ones of the
+    decompressed file and seeking decompresses up to the new position.
+    """
+    compression = get_compression(filename)
+    if compression == 'gzip':
+        return gzip.GzipFile(filename, "rb")
+    elif compression == 'bz2':
+        return bz2.BZ2File(filename, "rb")
+    elif compression == 'xz':
+        if lzma is None:
+            msg = "Reading xz compressed raw files requires the lzma module"
+            raise exceptions.InvalidRawFile(msg)
+        return lzma.LZMAFile(filename, "rb")
+    return open(filename, "rb")
+
 
 class spice_vector(object):
     """
@@ -48,7 +122,10 @@ class spice_vector(object):
     The attributes are:
       * name: vector name
       * type: frequency, voltage or current
+    Plots can hold 10^5 vectors, so the instances are kept slotted.
     """
+    __slots__ = ('data', 'name', 'type')
+
     def __init__(self, vector=numpy.array([]), **kwargs):
         self.data = vector
         self.name = ""
@@ -87,6 +164,11 @@ class spice_plot(object):
     This class holds a single spice plot
     It contains one scale vector and a list of several data vectors.
     The plot may have some attributes like "title", "date", ...
+
+    When the plot is read from a raw file the data of all vectors is kept
+    in one 2-D column store and the vectors are views of its columns.
+    Vectors can be looked up by name and several of them fetched as one
+    array with get_columns().
     """
     def __init__(self, scale=None, data=None, **kwargs):
         """
@@ -99,12 +181,19 @@ class spice_plot(object):
         self.plotname = "plotname undefined"
         self.plottype = "plottype undefined"
         self.dimensions = []
+        ## location of the values in the raw file, a spice_section
+        self.section = None
+        ## (npoints, ncols) column store holding the data of the vectors
+        self.values = None
+        ## column of the store for each vector, the scale first
+        self.columns = []
+        ## vector name -> position in [scale] + data vectors
+        self._index = None
 
         ## a single scale vector
         if scale is None:
-            scale = numpy.array([])
-        else:
-            self.scale_vector = scale
+            scale = spice_vector()
+        self.scale_vector = scale
 
         ## init the list of spice_vector
         if data is None:
@@ -133,18 +222,71 @@ class spice_plot(object):
         Set a spice_vector as the scale_vektor.
         """
         self.scale_vector = spice_vector
+        self._index = None
 
     def set_datavectors(self, spice_vector_list):
         """
         Set a list of spice_vector as data of spice_plot
         """
         self.data_vectors = spice_vector_list
+        self._index = None
 
     def append_datavector(self, spice_vector):
         """
         Append a single spice_vector to the data section
         """
         self.data_vectors.append(spice_vector)
+        self._index = None
+
+    def set_values(self, values, columns):
+        """
+        Set the (npoints, ncols) column store of the plot. columns gives the
+        column of each vector, the scale first, and every vector becomes a
+        view of its column. The vectors of a plot with dimensions are
+        reshaped to them, the last dimension varying the fastest.
+        """
+        self.values = values
+        self.columns = list(columns)
+        vectors = [self.scale_vector] + self.data_vectors
+        for n, vector in zip(self.columns, vectors):
+            if self.dimensions:
+                vector.set_data(_column(values, n).reshape(self.dimensions))
+            else:
+                vector.set_data(_column(values, n))
+
+    def _get_index(self):
+        if self._index is None:
+            vectors = [self.scale_vector] + self.data_vectors
+            self._index = dict((v.name, n) for n, v in enumerate(vectors))
+        return self._index
+
+    def get_vector_names(self):
+        """
+        returns the names of the data vectors
+        """
+        return [v.name for v in self.data_vectors]
+
+    def get_vector(self, name):
+        """
+        returns the scale or data vector called name as a spice_vector
+        """
+        n = self._get_index()[name]
+        if n == 0:
+            return self.scale_vector
+        return self.data_vectors[n - 1]
+
+    def get_columns(self, names):
+        """
+        returns the data of the vectors called names as one
+        (npoints, len(names)) numpy.array
+        """
+        index = self._get_index()
+        positions = [index[name] for name in names]
+        if self.values is None or self.values.dtype.names is not None:
+            vectors = [self.scale_vector] + self.data_vectors
+            return numpy.column_stack([vectors[n].get_data().ravel()
+                                       for n in positions])
+        return self.values[:, [self.columns[n] for n in positions]]
 
     def get_scalevector(self):
         """
@@ -165,6 +307,227 @@ class spice_plot(object):
         return self.data_vectors
 
 
+class spice_section(object):
+    """
+    Describes where the values of a spice plot are stored in the raw
+    file, so they can be read again without parsing the headers.
+    The data_type is None for an ascii "Values:" section.
+    """
+    def __init__(self, filename, offset, npoints, nvars, real=True,
+                 data_type=None):
+        self.filename = filename
+        self.offset = offset
+        self.npoints = npoints
+        self.nvars = nvars
+        self.real = real
+        self.data_type = data_type
+        ## length in bytes of the section, known once it has been read
+        self.length = None
+        ## (name, type) of all the variables stored in the section
+        self.variables = []
+        ## indices of the variables that are loaded, None for all of them
+        self.columns = None
+        if real:
+            self.ncols = nvars
+        else:
+            self.ncols = nvars * 2
+
+    def is_binary(self):
+        return self.data_type is not None
+
+    def is_record(self):
+        """
+        True if the columns of a binary section have different types, each
+        point is then a record of the structured data_type
+        """
+        return self.is_binary() and self.data_type.names is not None
+
+    def get_row_length(self):
+        """
+        returns the length in bytes of a point of a binary section
+        """
+        if self.is_record():
+            return self.data_type.itemsize
+        return self.ncols * self.data_type.itemsize
+
+    def get_length(self):
+        """
+        returns the length in bytes of a binary section
+        """
+        return self.npoints * self.get_row_length()
+
+    def get_shape(self, rows):
+        """
+        returns the shape of the array holding rows points of the section
+        """
+        if self.is_record():
+            return (rows,)
+        return (rows, self.ncols)
+
+    def decode(self, data, rows):
+        """
+        returns the array of rows points read from a binary section
+        """
+        block = numpy.frombuffer(data, dtype=self.data_type)
+        return block.reshape(self.get_shape(rows))
+
+    def select(self, block):
+        """
+        returns the loaded columns of an array of points of the section
+        """
+        raw_columns = self.get_raw_columns()
+        if raw_columns is None:
+            return block
+        if self.is_record():
+            names = self.data_type.names
+            return block[[names[c] for c in raw_columns]]
+        return block[:, raw_columns]
+
+    def get_selected_type(self):
+        """
+        returns the dtype of the loaded columns
+        """
+        if not self.is_binary():
+            return numpy.dtype(numpy.float64)
+        raw_columns = self.get_raw_columns()
+        if raw_columns is None or not self.is_record():
+            return self.data_type
+        names = self.data_type.names
+        return numpy.dtype([(names[c], self.data_type.fields[names[c]][0])
+                            for c in raw_columns])
+
+    def get_value_type(self):
+        """
+        returns the dtype of the vectors read from the section, the one of
+        the blocks iter_chunks() yields
+        """
+        if not self.is_binary() or self.is_record():
+            # ascii values are parsed as doubles and records are widened
+            value_type = numpy.dtype(numpy.float64)
+        else:
+            value_type = self.data_type
+        if self.real:
+            return value_type
+        return _complex_type(value_type)
+
+    def get_raw_columns(self):
+        """
+        returns the indices of the loaded columns of the section, a complex
+        variable is stored in two columns. None if all are loaded.
+        """
+        if self.columns is None or self.real:
+            return self.columns
+        return [c for n in self.columns for c in (2 * n, 2 * n + 1)]
+
+
+def _score_values(data, data_type, rows, ncols):
+    """
+    Rate how plausible the first rows points of a binary section are when
+    decoded with data_type. Returns the fraction of finite values of a sane
+    magnitude and the fraction of the scale steps going in its dominant
+    direction, wrong byte orders and precisions give denormal, huge or nan
+    values and a scale jumping around.
+    """
+    rows = min(rows, len(data) // (ncols * data_type.itemsize))
+    if rows == 0:
+        return (0.0, 0.0)
+    values = numpy.frombuffer(data[:rows * ncols * data_type.itemsize],
+                              dtype=data_type).reshape(rows, ncols)
+    with numpy.errstate(invalid='ignore', over='ignore'):
+        magnitude = numpy.abs(values.astype(numpy.float64))
+        sane = (magnitude == 0) | ((magnitude > 1e-30) & (magnitude < 1e30))
+        steps = numpy.diff(values[:, 0].astype(numpy.float64))
+        monotonic = max((steps >= 0).sum(), (steps <= 0).sum())
+    return (sane.mean(), float(monotonic) / max(len(steps), 1))
+
+
+def _column(values, n):
+    """
+    returns the n-th column of a column store, either a 2-D array or an
+    array of records
+    """
+    if values.dtype.names is not None:
+        return values[values.dtype.names[n]]
+    return values[:, n]
+
+
+def _complex_view(aa):
+    """
+    Reinterpret a (rows, 2 * n) array of interleaved real and imaginary
+    parts as a (rows, n) complex array. This is a view on the same memory,
+    only an array that is not contiguous (like the values parsed from an
+    ascii section) is copied once first.
+    """
+    if not aa.flags.c_contiguous:
+        aa = numpy.ascontiguousarray(aa)
+    return aa.view(_complex_type(aa.dtype))
+
+
+def _complex_type(data_type):
+    """
+    returns the complex dtype made of two data_type floats
+    """
+    if data_type.itemsize == 4:
+        complex_type = numpy.dtype(numpy.complex64)
+    else:
+        complex_type = numpy.dtype(numpy.complex128)
+    return complex_type.newbyteorder(data_type.byteorder)
+
+
+def _plot_to_index(plot):
+    """
+    Convert the headers and the section of a plot into a dict for the index
+    """
+    section = plot.section
+    if section.is_record():
+        data_type = section.data_type.descr
+    elif section.is_binary():
+        data_type = section.data_type.str
+    else:
+        data_type = None
+    return {
+        'title': plot.title,
+        'date': plot.date,
+        'plotname': plot.plotname,
+        'plottype': plot.plottype,
+        'dimensions': plot.dimensions,
+        'vectors': [list(v) for v in section.variables],
+        'offset': section.offset,
+        'length': section.length,
+        'npoints': section.npoints,
+        'real': section.real,
+        'data_type': data_type,
+    }
+
+
+def _plot_from_index(filename, header):
+    """
+    Create a spice_plot without values from an index entry
+    """
+    data_type = header['data_type']
+    if isinstance(data_type, list):
+        data_type = numpy.dtype([(str(name), str(field_type))
+                                 for name, field_type in data_type])
+    elif data_type is not None:
+        data_type = numpy.dtype(str(data_type))
+    # json gives back unicode, the rest of the reader works on str
+    vectors = [spice_vector(name=name.encode('utf-8'),
+                            type=vtype.encode('utf-8'))
+               for name, vtype in header['vectors']]
+    plot = spice_plot(scale=vectors[0], data=vectors[1:],
+                      title=header['title'].encode('utf-8'),
+                      date=header['date'].encode('utf-8'),
+                      plotname=header['plotname'].encode('utf-8'),
+                      plottype=header['plottype'].encode('utf-8'),
+                      dimensions=header['dimensions'])
+    plot.section = spice_section(filename, header['offset'],
+                                 header['npoints'], len(vectors),
+                                 real=header['real'], data_type=data_type)
+    plot.section.length = header['length']
+    plot.section.variables = [(v.name, v.type) for v in vectors]
+    return plot
+
+
 class SpiceReader(object):
     """
     This class is reads a spice data file and returns a list of spice_plot
@@ -172,12 +535,52 @@ class SpiceReader(object):
 
     The file syntax is mostly taken from the function raw_write() from
     ngspice-rework-17 file ./src/frontend/rawfile.c
+
+    If mmap is True (or the mmap option is set) the binary sections are
+    not read into memory. Each data vector is then a strided view over a
+    numpy.memmap of the file, so pages are only read when a vector is
+    actually used.
+
+    If load is False nothing is read on creation, the plots can then be
+    consumed one at a time with iter_plots() and iter_chunks(), or listed
+    with scan() and read with load_plot().
+
+    vectors is a list of names or glob patterns of the data vectors to
+    load (the vectors option by default). The other columns are skipped
+    when the values are read, the scale vector is always loaded.
+
+    The byte order and precision of the binary sections are detected once
+    per file, from the length of the first binary section and from the
+    values of its first points. little_endian and double_precision force
+    them instead (the options of the same names by default).
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, mmap=None, load=True, use_index=None,
+                 vectors=None, little_endian=None, double_precision=None):
         self.plots = []
+        self.filename = filename
+        if mmap is None:
+            mmap = CONF.mmap
+        self.mmap = mmap
+        if use_index is None:
+            use_index = CONF.raw_index
+        self.use_index = use_index
+        if vectors is None:
+            vectors = CONF.vectors
+        self.vector_patterns = vectors or []
+        if little_endian is None:
+            little_endian = CONF.little_endian
+        self.little_endian = little_endian
+        if double_precision is None:
+            double_precision = CONF.double_precision
+        self.double_precision = double_precision
+        self.compression = get_compression(filename)
+        self.data_type = None
+        ## True once a section was read with a dtype no value told apart
+        self.guessed_data_type = False
         self.set_default_values()
-        self.readfile(filename)
+        if load:
+            self.readfile(filename)
 
     def set_default_values(self):
         ## Set the default values for some options
@@ -188,17 +591,393 @@ class SpiceReader(object):
         self.padded = True
         self.real = True
         self.vectors = []
+        self.npoints_offset = None
 
-    def readfile(self, filename):
-        spice_file = open(filename, "rb")
+    def _read_binary(self, spice_file, section):
+        """
+        Read a binary section as a (npoints, ncols) array, or an array of
+        npoints records
+        """
+        length = section.get_length()
+        if not self.mmap or self.compression or length == 0:
+            data = spice_file.read(length)
+            if len(data) != length:
+                msg = "Binary section is truncated"
+                raise exceptions.InvalidRawFile(msg)
+            return section.decode(data, section.npoints)
+        try:
+            data = numpy.memmap(section.filename, dtype=section.data_type,
+                                mode='r', offset=section.offset,
+                                shape=section.get_shape(section.npoints))
+        except ValueError:
+            msg = "Binary section is truncated"
+            raise exceptions.InvalidRawFile(msg)
+        spice_file.seek(section.offset + length)
+        return data
+
+    def _read_value_lines(self, spice_file, nlines):
+        """
+        Read the next nlines value lines of an ascii values section
+        """
+        lines = []
+        while nlines > 0:
+            block = [spice_file.readline() for i in xrange(nlines)]
+            if block[-1] == "":
+                msg = "Values section is truncated"
+                raise exceptions.InvalidRawFile(msg)
+            # Every value is on its own line after a tab, anything else
+            # is a blank line between points
+            block = [l for l in block if "\t" in l]
+            nlines -= len(block)
+            lines.extend(block)
+        return lines
+
+    def _read_values(self, spice_file, section, npoints):
+        """
+        Read npoints of an ascii values section as a (npoints, ncols)
+        array. The lines of the section are collected in bulk and parsed
+        by numpy in one pass. Complex values are written as "re,im", so
+        they give two columns per variable.
+        """
+        lines = self._read_value_lines(spice_file, npoints * section.nvars)
+        return self._parse_values(lines, section, npoints)
+
+    def _parse_values(self, lines, section, npoints):
+        """
+        Parse the value lines of npoints of an ascii values section
+        """
+        ncols = section.ncols
+        text = string.replace("".join(lines), ",", " ")
+        a = numpy.fromstring(text, dtype=numpy.float64, sep=" ")
+        # The first value line of each point starts with the point index
+        if a.size == npoints * (ncols + 1):
+            return a.reshape(npoints, ncols + 1)[:, 1:]
+        elif a.size == npoints * ncols:
+            return a.reshape(npoints, ncols)
+        msg = "Values section does not match the number of variables"
+        raise exceptions.InvalidRawFile(msg)
+
+    def _skip_section(self, spice_file, section, chunk_points=65536):
+        """
+        Move the file position behind the values of a section
+        """
+        if section.is_binary():
+            spice_file.seek(section.offset + section.get_length())
+            return
+        remaining = section.npoints * section.nvars
+        while remaining > 0:
+            nlines = min(remaining, chunk_points)
+            self._read_value_lines(spice_file, nlines)
+            remaining -= nlines
+
+    def _select_vectors(self, plot):
+        """
+        Drop the data vectors of a plot that do not match the vector
+        selection and record the loaded columns in its section
+        """
+        if not self.vector_patterns:
+            plot.section.columns = None
+            return
+        columns = [0]
+        data_vectors = []
+        for n, vector in enumerate(plot.get_datavectors(), 1):
+            for pattern in self.vector_patterns:
+                if (vector.name == pattern or
+                        fnmatch.fnmatchcase(vector.name, pattern)):
+                    columns.append(n)
+                    data_vectors.append(vector)
+                    break
+        plot.set_datavectors(data_vectors)
+        plot.section.columns = columns
+
+    def _iter_blocks(self, spice_file, section, npoints):
+        """
+        Yield the loaded columns of a section from the current file
+        position in (rows, ncols) blocks of at most npoints rows
+        """
+        remaining = section.npoints
+        while remaining > 0:
+            rows = min(npoints, remaining)
+            if section.is_binary():
+                length = rows * section.get_row_length()
+                data = spice_file.read(length)
+                if len(data) != length:
+                    msg = "Binary section is truncated"
+                    raise exceptions.InvalidRawFile(msg)
+                block = section.decode(data, rows)
+            else:
+                block = self._read_values(spice_file, section, rows)
+            remaining -= rows
+            yield section.select(block)
+
+    def _read_section(self, spice_file, section, chunk_points=65536):
+        """
+        Read the values of a section from the current file position.
+        Returns a (npoints, ncols) array and the list of the variables
+        stored in its columns.
+        """
+        columns = section.columns
+        # Decompressed binary sections can't be mapped, they are filled
+        # block by block instead of being decompressed at once
+        streamed = self.compression and section.is_binary()
+        if not streamed and (columns is None or
+                             (self.mmap and section.is_binary())):
+            # Memory mapped vectors are views, skipped columns are
+            # simply never touched
+            if section.is_binary():
+                aa = self._read_binary(spice_file, section)
+            else:
+                aa = self._read_values(spice_file, section, section.npoints)
+            if columns is None:
+                columns = range(section.nvars)
+            return aa, columns
+        if columns is None:
+            columns = range(section.nvars)
+        data_type = section.get_selected_type()
+        raw_columns = section.get_raw_columns()
+        if section.is_record():
+            shape = (section.npoints,)
+        elif raw_columns is None:
+            shape = (section.npoints, section.ncols)
+        else:
+            shape = (section.npoints, len(raw_columns))
+        aa = numpy.empty(shape, dtype=data_type)
+        row = 0
+        for block in self._iter_blocks(spice_file, section, chunk_points):
+            aa[row:row + len(block)] = block
+            row += len(block)
+        return aa, range(len(columns))
+
+    def _set_vectors(self, plot, aa, columns):
+        """
+        Set the data of the vectors of a plot from the (npoints, ncols)
+        array of its values section. columns gives the variable stored in
+        aa for each vector of the plot.
+        """
+        # Complex number
+        if not plot.section.real:
+            aa = _complex_view(aa)
+        plot.set_values(aa, columns)
+
+    def iter_plots(self, load_data=True):
+        """
+        Parse the raw file and yield one spice_plot at a time.
+
+        If load_data is False the values sections are skipped and the
+        vectors of the yielded plots are empty. The values can then be
+        read with iter_chunks().
+        """
+        spice_file = open_raw(self.filename)
+        headers = []
+        self.guessed_data_type = False
+        try:
+            self.set_default_values()
+            for plot in self._parse(spice_file, load_data):
+                headers.append(_plot_to_index(plot))
+                yield plot
+        finally:
+            spice_file.close()
+        # A complete pass over the file is all that is needed for the
+        # index, a guessed dtype is detected again the next time
+        if self.use_index and not self.guessed_data_type:
+            self._save_index(headers)
+
+    def _get_index_key(self):
+        """
+        returns what the index of the raw file depends on, the file itself
+        and the byte order and precision forced on its values
+        """
+        stat = os.stat(self.filename)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime,
+                'little_endian': self.little_endian,
+                'double_precision': self.double_precision}
+
+    def _save_index(self, headers):
+        index = {'version': INDEX_VERSION, 'plots': headers}
+        index.update(self._get_index_key())
+        try:
+            with open(self.filename + INDEX_SUFFIX, "w") as index_file:
+                json.dump(index, index_file)
+        except (IOError, OSError, ValueError):
+            # The index is only a cache, a read-only directory or headers
+            # that are not valid utf-8 just mean there is no index
+            pass
+
+    def _load_index(self):
+        try:
+            with open(self.filename + INDEX_SUFFIX, "r") as index_file:
+                index = json.load(index_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if index.get('version') != INDEX_VERSION:
+            return None
+        for name, value in self._get_index_key().items():
+            if index.get(name) != value:
+                return None
+        plots = [_plot_from_index(self.filename, header)
+                 for header in index['plots']]
+        for plot in plots:
+            self._select_vectors(plot)
+        return plots
+
+    def scan(self):
+        """
+        Return the plots of the raw file with their headers and the
+        location of their values, but without reading any values.
+
+        The result is kept in a sidecar index file next to the raw file,
+        keyed by its size and mtime and by the byte order and precision
+        forced on the reader, so scanning the same file again does not
+        parse it at all. The values of a plot can then be read with
+        load_plot() or iter_chunks().
+        """
+        plots = None
+        if self.use_index:
+            plots = self._load_index()
+        if plots is None:
+            plots = list(self.iter_plots(load_data=False))
+        return plots
+
+    def load_plot(self, plot):
+        """
+        Read the values of a plot returned by scan() into its vectors
+        """
+        section = plot.section
+        spice_file = open_raw(section.filename)
+        try:
+            spice_file.seek(section.offset)
+            aa, columns = self._read_section(spice_file, section)
+        finally:
+            spice_file.close()
+        self._set_vectors(plot, aa, columns)
+        return plot
+
+    def _readline(self, spice_file):
+        """
+        Read the next header line
+        """
+        return spice_file.readline()
+
+    def _parse_keyword(self, keyword, tok):
+        """
+        Handle a header keyword the generic parser does not know about.
+        Returns True if it was handled.
+        """
+        return False
+
+    def _set_flag(self, flag):
+        if flag == "real":
+            self.real = True
+        elif flag == "complex":
+            self.real = False
+        elif flag == "unpadded":
+            self.padded = False
+        elif flag == "padded":
+            self.padded = True
+        else:
+            print 'Warning: unknown flag: "' + flag + '"'
+
+    def _get_data_type(self, spice_file, keyword):
+        """
+        returns the dtype of the values of the current plot, None for an
+        ascii values section
+        """
+        if keyword == "values":
+            return None
+        if self.data_type is not None:
+            return self.data_type
+        candidates = self._detect_data_type(spice_file)
+        if len(candidates) == 1:
+            # Only settled once a section tells the dtypes apart, sections
+            # of zeros decode the same in either byte order
+            self.data_type = candidates[0]
+        else:
+            self.guessed_data_type = True
+        return candidates[0]
+
+    def _get_candidate_types(self):
+        if self.double_precision is None:
+            sizes = ['f4', 'f8']
+        else:
+            sizes = ['f8' if self.double_precision else 'f4']
+        if self.little_endian is None:
+            orders = ['>', '<']
+        else:
+            orders = ['<' if self.little_endian else '>']
+        return [numpy.dtype(order + size) for size in sizes
+                for order in orders]
+
+    def _section_fits(self, spice_file, end):
+        """
+        True if a binary section ending at end is followed by the end of
+        the file or by the header of the next plot
+        """
+        if end == 0:
+            return spice_file.read(1) == ""
+        spice_file.seek(end - 1)
+        head = spice_file.read(17)
+        if len(head) < 2:
+            return len(head) == 1
+        return head[1:].lstrip().lower().startswith(("title:", "date:",
+                                                     "plotname:"))
+
+    def _detect_data_type(self, spice_file, rows=None):
+        """
+        Find the dtype of the binary section starting at the current file
+        position. Only the dtypes whose section length matches the end of
+        the file or the next header are kept, then the ones decoding the
+        first points most plausibly are returned, in the order of the
+        candidates. The values alone decide for compressed files, where
+        seeking back decompresses the file again from its start, and for
+        a section still being written, rows being its points written so
+        far.
+        """
+        candidates = self._get_candidate_types()
+        if len(candidates) == 1:
+            return candidates
+        offset = spice_file.tell()
+        if self.real:
+            ncols = self.nvars
+        else:
+            ncols = 2 * self.nvars
+        try:
+            if not self.compression and rows is None:
+                fitting = [data_type for data_type in candidates
+                           if self._section_fits(
+                               spice_file, offset + self.npoints * ncols *
+                               data_type.itemsize)]
+                # A truncated file fits none, the values have to decide
+                candidates = fitting or candidates
+            if rows is None:
+                rows = self.npoints
+            rows = min(rows, DETECT_POINTS)
+            spice_file.seek(offset)
+            data = spice_file.read(rows * ncols * 8)
+        finally:
+            spice_file.seek(offset)
+        scores = [_score_values(data, data_type, rows, ncols)
+                  for data_type in candidates]
+        best = max(scores)
+        return [data_type for data_type, score in zip(candidates, scores)
+                if score == best]
+
+    def _parse_header(self, spice_file):
+        """
+        Parse the header lines of the next plot up to its values section.
+        Returns the "values" or "binary" keyword that starts the section,
+        or None at the end of the file.
+        """
         while True:
-            line = spice_file.readline()
+            start = spice_file.tell()
+            line = self._readline(spice_file)
             if line == "":
-                return
+                return None
             tok = [string.strip(t) for t in string.split(line, ":", 1)]
             keyword = tok[0].lower()
 
-            if keyword == "title":
+            if self._parse_keyword(keyword, tok):
+                continue
+            elif keyword == "title":
                 self.current_plot.set_attributes(title=tok[1])
             elif keyword == "date":
                 self.current_plot.set_attributes(date=tok[1])
@@ -208,27 +987,25 @@ class SpiceReader(object):
                 ftok = [string.lower(string.strip(t))
                         for t in string.split(tok[1])]
                 for flag in ftok:
-                    if flag == "real":
-                        self.real = True
-                    elif flag == "complex":
-                        self.real = False
-                    elif flag == "unpadded":
-                        self.padded = False
-                    elif flag == "padded":
-                        self.padded = True
-                    else:
-                        print 'Warning: unknown flag: "' + flag + '"'
+                    self._set_flag(flag)
             elif keyword == "no. variables":
                 self.nvars = string.atoi(tok[1])
             elif keyword == "no. points":
                 self.npoints = string.atoi(tok[1])
+                self.npoints_offset = start
             elif keyword == "dimensions":
                 if self.npoints == 0:
                     print 'Error: misplaced "Dimensions:" lineprint'
                     continue
-                print 'Warning: "Dimensions" not supported yet'
-                # FIXME: How can I create such simulation files?
-                # numdims = string.atoi(tok[1])
+                # Nested sweeps, written as "Dimensions: 3,11" for
+                # 3 sweeps of 11 points each
+                dims = [string.atoi(d) for d in re.findall(r"\d+", tok[1])]
+                if reduce(operator.mul, dims, 1) != self.npoints:
+                    print 'Warning: "Dimensions" do not match the number ' \
+                          'of points, ignored'
+                    continue
+                self.numdims = len(dims)
+                self.current_plot.set_attributes(dimensions=dims)
             elif keyword == "command":
                 print 'Warning: "command" option not implemented yet'
                 print '\t' + line
@@ -239,7 +1016,8 @@ class SpiceReader(object):
                 # FIXME: what is this command good for
             elif keyword == "variables":
                 for i in xrange(self.nvars):
-                    line = string.split(string.strip(spice_file.readline()))
+                    line = string.split(string.strip(
+                        self._readline(spice_file)))
                     if len(line) >= 3:
                         curr_vector = spice_vector(name=line[1],
                                                    type=line[2])
@@ -253,68 +1031,7 @@ class SpiceReader(object):
                         print "list of variables is to short"
 
             elif keyword in ["values", "binary"]:
-                if not CONF.double_precision:
-                    data_type = numpy.dtype('float32')
-                    binary_length = self.nvars * self.npoints * 4
-                else:
-                    data_type = numpy.dtype('float64')
-                    binary_length = self.nvars * self.npoints * 8
-                if not CONF.little_endian:
-                    data_type = data_type.newbyteorder('>')
-                if self.real:
-                    if keyword == "values":
-                        length = self.npoints * self.nvars
-                        i = 0
-                        a = numpy.zeros(length,
-                                        dtype=data_type)
-                        while (i < length):
-                            t = string.split(spice_file.readline(), "\t")
-                            if len(t) < 2:
-                                continue
-                            else:
-                                a[i] = string.atof(t[1])
-                            i += 1
-                    else:
-                        data = spice_file.read(binary_length)
-                        array = numpy.frombuffer(data, dtype=data_type)
-                    aa = array.reshape(self.npoints, self.nvars)
-                    self.vectors[0].set_data(aa[:, 0])
-                    self.current_plot.set_scalevector(self.vectors[0])
-                    for n in xrange(1, self.nvars):
-                        self.vectors[n].set_data(aa[:, n])
-                        self.current_plot.append_datavector(self.vectors[n])
-                # Complex number
-                else:
-                    if keyword == "values":
-                        i = 0
-                        a = numpy.zeros(self.npoints * self.nvars * 2,
-                                        dtype=data_type)
-                        while (i < self.npoints * self.nvars * 2):
-                            t = string.split(spice_file.readline(), "\t")
-                            if len(t) < 2:
-                                continue
-                            else:
-                                t = string.split(t[1], ",")
-                                a[i] = string.atof(t[0])
-                                i += 1
-                                a[i] = string.atof(t[1])
-                                i += 1
-                    else:
-                        a = numpy.frombuffer(
-                            spice_file.read(binary_length * 2),
-                            dtype=data_type)
-                    aa = a.reshape(self.npoints, self.nvars * 2)
-                    # Only the real part:
-                    self.vectors[0].set_data(aa[:, 0])
-                    self.current_plot.set_scalevector(self.vectors[0])
-                    for n in xrange(1, self.nvars):
-                        self.vectors[n].set_data(
-                            numpy.array(aa[:, 2 * n] + 1j * aa[:, 2 * n + 1]))
-                        self.current_plot.append_datavector(self.vectors[n])
-
-                # Create a new plot after the data
-                self.plots.append(self.current_plot)
-                self.set_default_values()
+                return keyword
 
             elif string.strip(keyword) == "":
                 continue
@@ -323,5 +1040,386 @@ class SpiceReader(object):
                 msg = "Unexpected line in rawfile:\n" + line + "\nload aborted"
                 raise exceptions.InvalidRawFile(msg)
 
+    def _new_section(self, spice_file, keyword):
+        """
+        Create the section of the current plot, the values of which start
+        at the current file position, and add the vectors to the plot
+        """
+        data_type = self._get_data_type(spice_file, keyword)
+        section = spice_section(self.filename, spice_file.tell(),
+                                self.npoints, self.nvars,
+                                real=self.real, data_type=data_type)
+        section.variables = [(v.name, v.type) for v in self.vectors]
+        self.current_plot.section = section
+        self.current_plot.set_scalevector(self.vectors[0])
+        for n in xrange(1, self.nvars):
+            self.current_plot.append_datavector(self.vectors[n])
+        self._select_vectors(self.current_plot)
+        return section
+
+    def _parse(self, spice_file, load_data):
+        while True:
+            keyword = self._parse_header(spice_file)
+            if keyword is None:
+                return
+            section = self._new_section(spice_file, keyword)
+            if not load_data:
+                self._skip_section(spice_file, section)
+            else:
+                aa, columns = self._read_section(spice_file, section)
+                self._set_vectors(self.current_plot, aa, columns)
+            section.length = spice_file.tell() - section.offset
+
+            # Create a new plot after the data
+            plot = self.current_plot
+            self.set_default_values()
+            yield plot
+
+    def iter_chunks(self, plot, npoints=65536, spice_file=None):
+        """
+        Yield the values of a plot in blocks of at most npoints rows.
+        Each block is a (rows, nvars) array with the scale in the first
+        column and one column per loaded vector, so a plot can be
+        processed in constant memory.
+
+        spice_file is an open_raw() handle of the raw file to read the
+        values from, left open. Reading the plots of a compressed file in
+        order through one handle only ever seeks forward, a new handle
+        decompresses the file again from its start.
+        """
+        section = plot.section
+        raw_file = spice_file
+        if raw_file is None:
+            raw_file = open_raw(section.filename)
+        try:
+            raw_file.seek(section.offset)
+            for block in self._iter_blocks(raw_file, section, npoints):
+                if not section.real:
+                    block = _complex_view(block)
+                elif section.is_record():
+                    # Columns of different types only fit a 2-D block as
+                    # a copy to the widest type
+                    block = numpy.column_stack(
+                        [_column(block, n)
+                         for n in xrange(len(block.dtype.names))])
+                yield block
+        finally:
+            if spice_file is None:
+                raw_file.close()
+
+    def _wait_for_header(self, spice_file, poll_interval, timeout):
+        """
+        Wait until the headers of the first plot have been written
+        completely and parse them. Returns the section of the plot or None
+        if the file did not grow for timeout seconds.
+        """
+        content = ""
+        last_change = time.time()
+        while True:
+            data = spice_file.read(FOLLOW_READ_SIZE)
+            if data:
+                content += data
+                last_change = time.time()
+                lowered = content.lower()
+                if ("binary:\n" in lowered or "values:\n" in lowered):
+                    break
+            elif timeout is not None and time.time() - last_change > timeout:
+                return None
+            else:
+                time.sleep(poll_interval)
+                spice_file.seek(len(content))
+        spice_file.seek(0)
+        self.set_default_values()
+        keyword = self._parse_header(spice_file)
+        if (keyword == "binary" and self.data_type is None and
+                not self._wait_for_data_type(spice_file, poll_interval,
+                                             timeout)):
+            return None
+        return self._new_section(spice_file, keyword)
+
+    def _wait_for_data_type(self, spice_file, poll_interval, timeout):
+        """
+        Detect the dtype of the binary section starting at the current file
+        position while it is being written. The simulator only writes the
+        number of points once it is done, so the detection first waits for
+        DETECT_POINTS points of the widest dtype. Returns False if the file
+        did not grow for timeout seconds before a point was written, and
+        raises InvalidRawFile if the points can't tell the dtypes apart.
+        """
+        if len(self._get_candidate_types()) == 1:
+            return True
+        offset = spice_file.tell()
+        if self.real:
+            ncols = self.nvars
+        else:
+            ncols = 2 * self.nvars
+        written = 0
+        last_change = time.time()
+        while True:
+            npoints = self._read_written_npoints(spice_file)
+            if npoints:
+                # The whole section is written
+                self.npoints = npoints
+                rows = None
+                break
+            size = os.fstat(spice_file.fileno()).st_size - offset
+            if size != written:
+                written = size
+                last_change = time.time()
+            rows = written // (ncols * 8)
+            if rows >= DETECT_POINTS:
+                break
+            elif timeout is not None and time.time() - last_change > timeout:
+                if not rows:
+                    return False
+                break
+            time.sleep(poll_interval)
+        spice_file.seek(offset)
+        candidates = self._detect_data_type(spice_file, rows)
+        if len(candidates) > 1:
+            msg = ("Can't detect the byte order and precision of the values"
+                   " of %s, set the little-endian and double-precision"
+                   " options" % self.filename)
+            raise exceptions.InvalidRawFile(msg)
+        self.data_type = candidates[0]
+        return True
+
+    def _read_written_npoints(self, spice_file):
+        """
+        Read the number of points the simulator has written back into the
+        header, 0 while it is still running
+        """
+        if self.npoints_offset is None:
+            return 0
+        position = spice_file.tell()
+        spice_file.seek(self.npoints_offset)
+        tok = string.split(spice_file.readline(), ":", 1)
+        spice_file.seek(position)
+        try:
+            return string.atoi(string.strip(tok[1]))
+        except (IndexError, ValueError):
+            return 0
+
+    def follow(self, poll_interval=1.0, timeout=None):
+        """
+        Follow the first plot of a raw file that is still being written by
+        a running simulator.
+
+        The headers are parsed once, then the values section is polled and
+        every block of newly completed points is yielded as a (plot, block)
+        tuple, the block being a (rows, nvars) array like iter_chunks()
+        returns. Nothing is read twice. Following stops once the number of
+        points the simulator writes back into the header on exit has been
+        read, at the next plot, or when the file did not grow for timeout
+        seconds. The dtype of a binary section is detected once its first
+        points are written.
+        """
+        if self.compression:
+            msg = "Compressed raw files can't be followed"
+            raise exceptions.InvalidRawFile(msg)
+        spice_file = open(self.filename, "rb")
+        try:
+            section = self._wait_for_header(spice_file, poll_interval,
+                                            timeout)
+            if section is None:
+                return
+            plot = self.current_plot
+            position = section.offset
+            pending = ""
+            lines = []
+            done = 0
+            finished = False
+            last_change = time.time()
+            while not finished:
+                # Read the count first, the points before it are complete
+                npoints = self._read_written_npoints(spice_file)
+                spice_file.seek(position)
+                new_data = spice_file.read(FOLLOW_READ_SIZE)
+                position += len(new_data)
+                # A partial point or line is kept until it is completed
+                data = pending + new_data
+                if section.is_binary():
+                    row_length = section.get_row_length()
+                    rows = len(data) // row_length
+                    if npoints:
+                        # Anything behind the last point is the next plot
+                        rows = min(rows, npoints - done)
+                    pending = data[rows * row_length:]
+                    block = section.decode(data[:rows * row_length], rows)
+                else:
+                    # Only complete lines, the last one may still be written
+                    end = data.rfind("\n") + 1
+                    pending = data[end:]
+                    for line in data[:end].splitlines(True):
+                        if "\t" in line:
+                            lines.append(line)
+                        elif string.strip(line):
+                            # Headers of the next plot
+                            finished = True
+                            break
+                    rows = len(lines) // section.nvars
+                    used = rows * section.nvars
+                    if rows:
+                        block = self._parse_values(lines[:used], section,
+                                                   rows)
+                    lines = lines[used:]
+                if rows:
+                    last_change = time.time()
+                    done += rows
+                    block = section.select(block)
+                    if not section.real:
+                        block = _complex_view(block)
+                    yield plot, block
+                if npoints and done >= npoints:
+                    finished = True
+                elif new_data:
+                    continue
+                elif (timeout is not None and
+                        time.time() - last_change > timeout):
+                    finished = True
+                else:
+                    time.sleep(poll_interval)
+        finally:
+            spice_file.close()
+
+    def readfile(self, filename):
+        if filename != self.filename:
+            self.filename = filename
+            self.compression = get_compression(filename)
+            self.data_type = None
+        for plot in self.iter_plots():
+            self.plots.append(plot)
+
     def get_plots(self):
         return self.plots
+
+
+def _is_utf16(head):
+    """
+    True if a header is utf-16 encoded, as LTspice writes them
+    """
+    return len(head) > 1 and head[1] == "\x00"
+
+
+def _is_ltspice(head):
+    """
+    True if the start of a raw file was written by LTspice, which writes
+    utf-16 headers or names itself on the "Command:" line. The other
+    lines, the title first, are left alone.
+    """
+    if _is_utf16(head):
+        return True
+    for line in head.splitlines():
+        tok = string.split(line, ":", 1)
+        keyword = string.lower(string.strip(tok[0]))
+        if keyword in ("binary", "values"):
+            break
+        elif keyword == "command" and len(tok) > 1:
+            command = string.lower(tok[1])
+            return "ltspice" in command or "linear technology" in command
+    return False
+
+
+class LTSpiceReader(SpiceReader):
+    """
+    Reader for the raw files written by LTspice.
+
+    The header may be utf-16 encoded and the values are always little
+    endian. Real plots store the scale as float64 and the other vectors as
+    float32, unless the "double" flag is set; each point is then decoded
+    as one record and every vector is a view of its field. LTspice uses
+    the sign bit of the time as a flag, so the scale is the absolute value
+    of the stored time.
+    """
+    def __init__(self, filename, **kwargs):
+        spice_file = open_raw(filename)
+        try:
+            self.utf16 = _is_utf16(spice_file.read(2))
+        finally:
+            spice_file.close()
+        super(LTSpiceReader, self).__init__(filename, **kwargs)
+
+    def set_default_values(self):
+        super(LTSpiceReader, self).set_default_values()
+        self.double = False
+        self.fastaccess = False
+
+    def _readline(self, spice_file):
+        if not self.utf16:
+            return spice_file.readline()
+        line = ""
+        while True:
+            part = spice_file.readline()
+            line += part
+            if not part.endswith("\n"):
+                break
+            # A newline is followed by its zero high byte, any other byte
+            # means the low byte of a character was 0x0a
+            pad = spice_file.read(1)
+            line += pad
+            if pad in ("\x00", ""):
+                break
+        line = line[:len(line) // 2 * 2].decode('utf-16-le')
+        return line.lstrip(u"\ufeff").encode('utf-8')
+
+    def _parse_keyword(self, keyword, tok):
+        return keyword in ("offset", "command", "backannotation")
+
+    def _set_flag(self, flag):
+        if flag == "double":
+            self.double = True
+        elif flag == "fastaccess":
+            self.fastaccess = True
+        elif flag in ("forward", "log", "stepped"):
+            pass
+        else:
+            super(LTSpiceReader, self)._set_flag(flag)
+
+    def _wait_for_data_type(self, spice_file, poll_interval, timeout):
+        # The flags give the dtype
+        return True
+
+    def _get_data_type(self, spice_file, keyword):
+        if keyword == "values":
+            if self.utf16:
+                msg = "utf-16 Values sections are not supported"
+                raise exceptions.InvalidRawFile(msg)
+            return None
+        if self.fastaccess:
+            msg = "fastaccess raw files are not supported"
+            raise exceptions.InvalidRawFile(msg)
+        if not self.real or self.double:
+            return numpy.dtype('<f8')
+        return numpy.dtype([('f0', '<f8')] +
+                           [('f%d' % n, '<f4')
+                            for n in xrange(1, self.nvars)])
+
+    def _set_vectors(self, plot, aa, columns):
+        super(LTSpiceReader, self)._set_vectors(plot, aa, columns)
+        if plot.section.real:
+            scale = plot.get_scalevector()
+            scale.set_data(numpy.abs(scale.get_data()))
+
+    def iter_chunks(self, plot, npoints=65536, spice_file=None):
+        # The scale is always the first loaded column
+        for block in super(LTSpiceReader, self).iter_chunks(plot, npoints,
+                                                            spice_file):
+            if plot.section.real:
+                block = numpy.array(block)
+                block[:, 0] = numpy.abs(block[:, 0])
+            yield block
+
+
+def get_reader(filename, **kwargs):
+    """
+    Return the reader for a raw file, an LTSpiceReader for the files
+    written by LTspice and a SpiceReader otherwise
+    """
+    spice_file = open_raw(filename)
+    try:
+        head = spice_file.read(4096)
+    finally:
+        spice_file.close()
+    if _is_ltspice(head):
+        return LTSpiceReader(filename, **kwargs)
+    return SpiceReader(filename, **kwargs)
@@ -0,0 +1,59 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+from oslo.config import cfg
+import testtools
+
+# The options of every module are registered before they are parsed
+from powerpyspice.benchmark import rawgen
+from powerpyspice.hdf import backend  # noqa
+from powerpyspice.hdf import cache  # noqa
+from powerpyspice.hdf import spice_to_hdf  # noqa
+from powerpyspice import spice  # noqa
+
+CONF = cfg.CONF
+
+
+class TestCase(testtools.TestCase):
+    """
+    Base test case, with the options parsed from an empty command line
+    and a temporary directory for the files of every test
+    """
+    def setUp(self):
+        super(TestCase, self).setUp()
+        CONF([], project='power-pyspice', default_config_files=[])
+        self.addCleanup(CONF.reset)
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+
+    def flags(self, **kwargs):
+        """
+        Override options for the duration of a test
+        """
+        for name, value in kwargs.items():
+            CONF.set_override(name, value)
+            self.addCleanup(CONF.clear_override, name)
+
+    def get_path(self, name):
+        return os.path.join(self.tempdir, name)
+
+    def write_raw(self, name, npoints, nvars, **kwargs):
+        """
+        Write a synthetic raw file with rawgen and return its path
+        """
+        path = self.get_path(name)
+        rawgen.write_raw(path, npoints, nvars, **kwargs)
+        return path
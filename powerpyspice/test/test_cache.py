@@ -0,0 +1,64 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+
+from powerpyspice.hdf import cache
+from powerpyspice.hdf import spice_to_hdf
+from powerpyspice.test import base
+
+
+class TestIngestCache(base.TestCase):
+    def setUp(self):
+        super(TestIngestCache, self).setUp()
+        self.raw = self.write_raw('test.raw', 1000, 4)
+        self.cache_dir = self.get_path('cache')
+        self.cache = cache.IngestCache(cache_dir=self.cache_dir)
+
+    def test_get_hdf_file(self):
+        path = self.cache.get_hdf_file(self.raw)
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(path, self.cache.lookup(self.raw))
+        self.assertEqual(path, self.cache.get_hdf_file(self.raw))
+        # Only the hdf5 file and its provenance are left
+        self.assertEqual(sorted([os.path.basename(path),
+                                 os.path.splitext(
+                                     os.path.basename(path))[0] + '.json']),
+                         sorted(os.listdir(self.cache_dir)))
+
+    def test_format_version(self):
+        path = self.cache.get_hdf_file(self.raw)
+        self.useFixture(fixtures.MonkeyPatch(
+            'powerpyspice.hdf.spice_to_hdf.FORMAT_VERSION',
+            spice_to_hdf.FORMAT_VERSION + 1))
+        self.assertIsNone(self.cache.lookup(self.raw))
+        self.assertNotEqual(path, self.cache.get_hdf_file(self.raw))
+
+    def test_options(self):
+        path = self.cache.get_hdf_file(self.raw)
+        self.flags(hdf_layout='matrix')
+        self.assertNotEqual(path, self.cache.get_hdf_file(self.raw))
+
+    def test_is_enabled(self):
+        self.assertTrue(cache.is_enabled())
+        self.flags(hdf_file='out.h5')
+        self.assertFalse(cache.is_enabled())
+
+    def test_is_enabled_out_dir(self):
+        self.flags(hdf_out_dir=self.tempdir)
+        self.assertFalse(cache.is_enabled())
+        self.assertEqual(os.path.join(self.tempdir, 'spice.h5'),
+                         spice_to_hdf.get_hdf_path())
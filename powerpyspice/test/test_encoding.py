@@ -0,0 +1,98 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import numpy
+from numpy import testing
+
+from powerpyspice.benchmark import rawgen
+from powerpyspice import exceptions
+from powerpyspice.hdf import encoding
+from powerpyspice.test import base
+
+
+class TestDeltaEncoding(base.TestCase):
+    def setUp(self):
+        super(TestDeltaEncoding, self).setUp()
+        self.scale = rawgen.get_values(1000, 2)[0][:, 0]
+
+    def _encode(self, points, sizes):
+        encoder = encoding.DeltaEncoder(points)
+        parts = numpy.split(self.scale, numpy.cumsum(sizes)[:-1])
+        return numpy.concatenate([encoder.encode(part) for part in parts])
+
+    def test_round_trip(self):
+        # Blocks of values not aligned to the blocks of points
+        deltas = self._encode(128, [100, 300, 1, 599])
+        testing.assert_allclose(encoding.decode_deltas(deltas, 128),
+                                self.scale, rtol=1e-12)
+
+    def test_anchors(self):
+        deltas = self._encode(128, [1000])
+        testing.assert_array_equal(deltas[::128], self.scale[::128])
+
+    def test_decode_block(self):
+        deltas = self._encode(128, [1000])
+        testing.assert_allclose(encoding.decode_deltas(deltas[256:300], 128),
+                                self.scale[256:300], rtol=1e-12)
+
+    def test_empty(self):
+        encoder = encoding.DeltaEncoder(128)
+        self.assertEqual(0, len(encoder.encode(numpy.array([]))))
+
+
+class TestDowncastEncoding(base.TestCase):
+    def setUp(self):
+        super(TestDowncastEncoding, self).setUp()
+        self.values = rawgen.get_values(1000, 2)[0][:, 1]
+
+    def test_downcast(self):
+        encoder = encoding.DowncastEncoder('v(n1)', 'float32', 1e-6)
+        encoded = encoder.encode(self.values)
+        self.assertEqual(numpy.dtype(numpy.float32), encoded.dtype)
+        testing.assert_array_equal(self.values.astype(numpy.float32),
+                                   encoded)
+        encoder.finish()
+
+    def test_tolerance(self):
+        encoder = encoding.DowncastEncoder('v(n1)', 'float16', 1e-6)
+        encoder.encode(self.values)
+        self.assertRaises(exceptions.DowncastError, encoder.finish)
+
+    def test_overflow(self):
+        encoder = encoding.DowncastEncoder('v(n1)', 'float16', 1e-2)
+        encoder.encode(self.values * 1e6)
+        self.assertRaises(exceptions.DowncastError, encoder.finish)
+
+    def test_vector_peak(self):
+        # Only the first block on its own loses more than the tolerance
+        values = numpy.concatenate((self.values * 1e-6, self.values))
+        for sizes in ([2000], [1000, 1000], [10, 1990]):
+            encoder = encoding.DowncastEncoder('v(n1)', 'float16', 1e-3)
+            parts = numpy.split(values, numpy.cumsum(sizes)[:-1])
+            encoded = numpy.concatenate([encoder.encode(part)
+                                         for part in parts])
+            encoder.finish()
+            testing.assert_array_equal(values.astype(numpy.float16),
+                                       encoded)
+        encoder = encoding.DowncastEncoder('v(n1)', 'float16', 1e-3)
+        encoder.encode(values[:1000])
+        self.assertRaises(exceptions.DowncastError, encoder.finish)
+
+    def test_complex_type(self):
+        self.assertEqual(numpy.dtype(numpy.complex64),
+                         encoding.get_downcast_type(numpy.complex128,
+                                                    'float16'))
+        self.assertEqual(numpy.dtype(numpy.float16),
+                         encoding.get_downcast_type(numpy.float64,
+                                                    'float16'))
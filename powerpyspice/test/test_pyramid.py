@@ -0,0 +1,125 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import numpy
+from numpy import testing
+
+from powerpyspice.benchmark import rawgen
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import pyramid
+from powerpyspice.hdf import reader
+from powerpyspice.hdf import spice_to_hdf
+from powerpyspice.test import base
+
+# Not a multiple of any decimation, the last bin of every level is partial
+NPOINTS = 1000
+NVARS = 4
+FACTOR = 4
+
+
+def get_bins(values, decimation):
+    """
+    returns the (min, max, mean) of every decimation points of values,
+    computed by numpy
+    """
+    bins = [values[start:start + decimation]
+            for start in xrange(0, len(values), decimation)]
+    return (numpy.array([points.min(axis=0) for points in bins]),
+            numpy.array([points.max(axis=0) for points in bins]),
+            numpy.array([points.mean(axis=0) for points in bins]))
+
+
+class TestPyramidBuilder(base.TestCase):
+    def setUp(self):
+        super(TestPyramidBuilder, self).setUp()
+        self.values = rawgen.get_values(NPOINTS, NVARS)[0]
+
+    def _build(self, sizes):
+        """
+        Build the pyramid of the values from blocks of the given sizes and
+        return its group
+        """
+        path = self.get_path('test%d.h5' % len(sizes))
+        writer = spice_to_hdf.HdfWriter(path, swmr=False)
+        writer.open()
+        self.addCleanup(writer.close)
+        group = writer.h5file.create_group('plot')
+        builder = pyramid.PyramidBuilder(writer, group, NVARS,
+                                         self.values.dtype, NPOINTS, FACTOR)
+        for block in numpy.split(self.values, numpy.cumsum(sizes)[:-1]):
+            builder.add_block(block)
+        builder.finish()
+        writer.flush()
+        return group[pyramid.PYRAMID_GROUP]
+
+    def test_levels(self):
+        self.assertEqual([4, 16, 64, 256],
+                         pyramid.get_decimations(NPOINTS, FACTOR))
+        # Blocks not aligned to the bins of any level
+        for sizes in ([NPOINTS], [100, 1, 899], [7] * 142 + [6]):
+            group = self._build(sizes)
+            self.assertEqual(FACTOR, group.attrs['factor'])
+            for k, decimation in enumerate(
+                    pyramid.get_decimations(NPOINTS, FACTOR)):
+                level = group['level-%d' % (k + 1)]
+                self.assertEqual(decimation, level.attrs['decimation'])
+                for stat, expected in zip(pyramid.PYRAMID_STATS,
+                                          get_bins(self.values, decimation)):
+                    testing.assert_allclose(level[stat][...], expected,
+                                            rtol=1e-12)
+
+
+class TestGetDecimated(base.TestCase):
+    def setUp(self):
+        super(TestGetDecimated, self).setUp()
+        raw = self.write_raw('test.raw', NPOINTS, NVARS)
+        self.flags(hdf_pyramid=True, hdf_pyramid_factor=FACTOR)
+        path = self.get_path('test.h5')
+        spice_to_hdf.HdfCreate(raw, path)
+        h5file = backend.open_file(path)
+        self.addCleanup(h5file.close)
+        self.plot = reader.HdfPlot(h5file['Transient Analysis'])
+        values = rawgen.get_values(NPOINTS, NVARS)[0]
+        self.values = values.astype(numpy.float32)
+
+    def _check_bins(self, decimated, decimation, bins):
+        self.assertEqual(decimation, decimated.decimation)
+        minimum, maximum, mean = [stat[bins] for stat in
+                                  get_bins(self.values, decimation)]
+        testing.assert_allclose(decimated.scale, mean[:, 0], rtol=1e-6)
+        testing.assert_array_equal(decimated.minimum['v(n1)'], minimum[:, 1])
+        testing.assert_array_equal(decimated.maximum['v(n1)'], maximum[:, 1])
+        testing.assert_allclose(decimated.mean['v(n1)'], mean[:, 1],
+                                rtol=1e-5)
+
+    def test_whole_plot(self):
+        decimated = self.plot.get_decimated(['v(n1)'], 100)
+        self._check_bins(decimated, 16, slice(None))
+        self.assertEqual(63, len(decimated.scale))
+
+    def test_window(self):
+        scale = self.values[:, 0]
+        # Points 300 to 700 are in the bins 18 to 43 of 16 points
+        decimated = self.plot.get_decimated(['v(n1)'], 30, scale[300],
+                                            scale[700])
+        self._check_bins(decimated, 16, slice(18, 44))
+
+    def test_points(self):
+        scale = self.values[:, 0]
+        decimated = self.plot.get_decimated(['v(n1)'], 401, scale[300],
+                                            scale[700])
+        self.assertEqual(1, decimated.decimation)
+        testing.assert_array_equal(decimated.scale, scale[300:701])
+        testing.assert_array_equal(decimated.minimum['v(n1)'],
+                                   self.values[300:701, 1])
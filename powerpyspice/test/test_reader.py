@@ -0,0 +1,177 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import numpy
+from numpy import testing
+
+from powerpyspice.benchmark import rawgen
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import reader
+from powerpyspice.hdf import spice_to_hdf
+from powerpyspice.test import base
+
+NPOINTS = 1000
+NVARS = 4
+NPLOTS = 1
+
+
+class TestHdfPlot(base.TestCase):
+    """
+    Read back converted plots in every layout and backend
+    """
+    def setUp(self):
+        super(TestHdfPlot, self).setUp()
+        self.converted = 0
+
+    def _convert(self, layout, store, real=True, **flags):
+        self.flags(hdf_layout=layout, hdf_backend=store, hdf_chunk_points=256,
+                   **flags)
+        raw = self.write_raw('test.raw', NPOINTS, NVARS, nplots=NPLOTS,
+                             real=real)
+        self.converted += 1
+        path = self.get_path('test%d%s' % (self.converted,
+                                           backend.SUFFIXES[store]))
+        spice_to_hdf.HdfCreate(raw, path)
+        h5file = backend.open_file(path)
+        self.addCleanup(h5file.close)
+        groups = sorted(h5file.values(), key=lambda group: group.attrs['id'])
+        self.assertEqual(NPLOTS, len(groups))
+        if real:
+            data_type = numpy.float32
+        else:
+            data_type = numpy.complex64
+        expected = [values.astype(data_type) for values in
+                    rawgen.get_values(NPOINTS, NVARS, nplots=NPLOTS,
+                                      real=real)]
+        return [reader.HdfPlot(group) for group in groups], expected
+
+    def _check_plots(self, plots, expected):
+        for plot, values in zip(plots, expected):
+            if numpy.iscomplexobj(values):
+                self.assertEqual('frequency', plot.get_scale_name())
+            else:
+                self.assertEqual('time', plot.get_scale_name())
+            names = plot.get_vector_names()
+            self.assertEqual(['v(n1)', 'i(v2)', 'v(n3)'], names)
+            self.assertEqual(NPOINTS, plot.get_npoints())
+            testing.assert_array_equal(plot.get_scale(), values[:, 0])
+            for n, name in enumerate(names):
+                testing.assert_array_equal(plot.get_vector(name),
+                                           values[:, n + 1])
+            testing.assert_array_equal(
+                plot.get_vector(names[1], slice(300, 700)),
+                values[300:700, 2])
+
+    def _check_window(self, plot, values):
+        scale = values[:, 0]
+        t0, t1 = scale[300], scale[700]
+        self.assertEqual(300, plot.find_point(t0))
+        scale, vectors = plot.get_window(['v(n1)'], t0, t1)
+        testing.assert_array_equal(scale, values[300:701, 0])
+        testing.assert_array_equal(vectors['v(n1)'], values[300:701, 1])
+
+    def test_layouts_and_backends(self):
+        for layout in (reader.LAYOUT_VECTORS, reader.LAYOUT_MATRIX):
+            for store in (backend.BACKEND_HDF5, backend.BACKEND_NPY):
+                plots, expected = self._convert(layout, store)
+                self.assertEqual(layout == reader.LAYOUT_MATRIX,
+                                 plots[0].is_matrix())
+                self._check_plots(plots, expected)
+                self._check_window(plots[0], expected[0])
+
+    def test_complex(self):
+        for layout in (reader.LAYOUT_VECTORS, reader.LAYOUT_MATRIX):
+            for store in (backend.BACKEND_HDF5, backend.BACKEND_NPY):
+                plots, expected = self._convert(layout, store, real=False)
+                self._check_plots(plots, expected)
+
+    def test_delta_scale(self):
+        for store in (backend.BACKEND_HDF5, backend.BACKEND_NPY):
+            plots, expected = self._convert(reader.LAYOUT_VECTORS, store,
+                                            hdf_scale_encoding='delta')
+            for plot, values in zip(plots, expected):
+                testing.assert_allclose(plot.get_scale(), values[:, 0],
+                                        rtol=1e-6)
+                testing.assert_allclose(plot.get_scale(slice(300, 700)),
+                                        values[300:700, 0], rtol=1e-6)
+                self._check_window(plot, values)
+
+    def test_downcast(self):
+        for store in (backend.BACKEND_HDF5, backend.BACKEND_NPY):
+            plots, expected = self._convert(reader.LAYOUT_VECTORS, store,
+                                            hdf_downcast='float16',
+                                            hdf_downcast_tolerance=1e-3)
+            for plot, values in zip(plots, expected):
+                vector = plot.get_vector('v(n1)')
+                self.assertEqual(numpy.dtype(numpy.float32), vector.dtype)
+                testing.assert_allclose(vector, values[:, 1], atol=1e-3)
+
+    def test_dimensions(self):
+        # Nested sweeps are stored flat and reshaped when read whole
+        raw = self.write_raw('test.raw', 12, NVARS, dimensions=(3, 4))
+        values = rawgen.get_values(12, NVARS)[0].astype(numpy.float32)
+        for layout in (reader.LAYOUT_VECTORS, reader.LAYOUT_MATRIX):
+            self.flags(hdf_layout=layout)
+            path = self.get_path('%s.h5' % layout)
+            spice_to_hdf.HdfCreate(raw, path)
+            h5file = backend.open_file(path)
+            self.addCleanup(h5file.close)
+            plot = reader.HdfPlot(h5file['Transient Analysis'])
+            self.assertEqual((3, 4), plot.dimensions)
+            self.assertEqual(12, plot.get_npoints())
+            if layout == reader.LAYOUT_MATRIX:
+                self.assertEqual((12, NVARS), plot.group['values'].shape)
+            else:
+                self.assertEqual((12,), plot.group['scale'].shape)
+            testing.assert_array_equal(plot.get_scale(),
+                                       values[:, 0].reshape(3, 4))
+            for n, name in enumerate(plot.get_vector_names(), 1):
+                testing.assert_array_equal(plot.get_vector(name),
+                                           values[:, n].reshape(3, 4))
+            testing.assert_array_equal(plot.get_vector('v(n1)', slice(2, 7)),
+                                       values[2:7, 1])
+
+    def test_plots_of_one_group(self):
+        # The gui reads the vector names and the plot through two HdfPlots
+        for swmr in (False, True):
+            plots, expected = self._convert(reader.LAYOUT_VECTORS,
+                                            backend.BACKEND_HDF5,
+                                            hdf_swmr=swmr)
+            names = plots[0].get_vector_names()
+            plot = reader.HdfPlot(plots[0].group)
+            testing.assert_array_equal(plot.get_scale(), expected[0][:, 0])
+            testing.assert_array_equal(plot.get_vector(names[0]),
+                                       expected[0][:, 1])
+
+    def test_refresh(self):
+        for swmr in (False, True):
+            plots, expected = self._convert(reader.LAYOUT_VECTORS,
+                                            backend.BACKEND_HDF5,
+                                            hdf_swmr=swmr)
+            plots[0].refresh()
+            testing.assert_array_equal(plots[0].get_scale(),
+                                       expected[0][:, 0])
+
+    def test_scaleoffset(self):
+        # The scale-offset filter only takes 4 and 8 byte floats
+        for downcast, scaleoffset in (('none', 3), ('float16', None)):
+            plots, expected = self._convert(reader.LAYOUT_VECTORS,
+                                            backend.BACKEND_HDF5,
+                                            hdf_scaleoffset=3,
+                                            hdf_downcast=downcast,
+                                            hdf_downcast_tolerance=1e-3)
+            self.assertEqual(scaleoffset,
+                             plots[0].group['data_vector-0'].scaleoffset)
+            testing.assert_allclose(plots[0].get_vector('v(n1)'),
+                                    expected[0][:, 1], atol=1e-3)
@@ -0,0 +1,460 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import gzip
+import os
+import shutil
+
+import fixtures
+import numpy
+from numpy import testing
+
+from powerpyspice.benchmark import rawgen
+from powerpyspice import spice
+from powerpyspice.test import base
+
+NPOINTS = 500
+NVARS = 4
+
+
+def get_values(plot):
+    vectors = [plot.get_scalevector()] + plot.get_datavectors()
+    return numpy.column_stack([vector.get_data() for vector in vectors])
+
+
+class TestRoundTrip(base.TestCase):
+    """
+    Read back the raw files written by rawgen in every format
+    """
+    def _read(self, nplots=1, **kwargs):
+        path = self.write_raw('test.raw', NPOINTS, NVARS, nplots=nplots,
+                              **kwargs)
+        plots = spice.SpiceReader(path, use_index=False).get_plots()
+        real = kwargs.get('real', True)
+        expected = rawgen.get_values(NPOINTS, NVARS, nplots=nplots,
+                                     real=real)
+        self.assertEqual(nplots, len(plots))
+        return plots, expected
+
+    def test_binary_real(self):
+        plots, expected = self._read()
+        testing.assert_array_equal(get_values(plots[0]),
+                                   expected[0].astype(numpy.float32))
+        self.assertEqual(['v(n1)', 'i(v2)', 'v(n3)'],
+                         plots[0].get_vector_names())
+
+    def test_binary_real_double(self):
+        plots, expected = self._read(double=True, little_endian=True)
+        testing.assert_array_equal(get_values(plots[0]), expected[0])
+
+    def test_binary_complex(self):
+        plots, expected = self._read(real=False)
+        testing.assert_array_equal(get_values(plots[0]),
+                                   expected[0].astype(numpy.complex64))
+
+    def test_binary_complex_double(self):
+        plots, expected = self._read(real=False, double=True)
+        testing.assert_array_equal(get_values(plots[0]), expected[0])
+
+    def test_ascii_real(self):
+        plots, expected = self._read(binary=False, double=True)
+        testing.assert_allclose(get_values(plots[0]), expected[0],
+                                rtol=1e-14)
+
+    def test_ascii_complex(self):
+        plots, expected = self._read(binary=False, real=False)
+        testing.assert_allclose(get_values(plots[0]), expected[0],
+                                rtol=1e-6)
+
+    def test_several_plots(self):
+        plots, expected = self._read(nplots=3)
+        for plot, values in zip(plots, expected):
+            testing.assert_array_equal(get_values(plot),
+                                       values.astype(numpy.float32))
+
+    def test_iter_chunks(self):
+        path = self.write_raw('test.raw', NPOINTS, NVARS, nplots=2)
+        reader = spice.SpiceReader(path, load=False, use_index=False)
+        expected = rawgen.get_values(NPOINTS, NVARS, nplots=2)
+        for plot, values in zip(reader.scan(), expected):
+            blocks = list(reader.iter_chunks(plot, 128))
+            self.assertEqual(4, len(blocks))
+            testing.assert_array_equal(numpy.concatenate(blocks),
+                                       values.astype(numpy.float32))
+
+    def test_iter_chunks_one_handle(self):
+        path = self.write_raw('test.raw', NPOINTS, NVARS, nplots=3)
+        with open(path, 'rb') as raw_file:
+            with gzip.GzipFile(path + '.gz', 'wb') as gzip_file:
+                shutil.copyfileobj(raw_file, gzip_file)
+        reader = spice.SpiceReader(path + '.gz', load=False, use_index=False)
+        expected = rawgen.get_values(NPOINTS, NVARS, nplots=3)
+        spice_file = spice.open_raw(path + '.gz')
+        self.addCleanup(spice_file.close)
+        for plot, values in zip(reader.scan(), expected):
+            blocks = list(reader.iter_chunks(plot, 128, spice_file))
+            testing.assert_array_equal(numpy.concatenate(blocks),
+                                       values.astype(numpy.float32))
+        self.assertFalse(spice_file.closed)
+
+
+class TestMmap(base.TestCase):
+    """
+    Map the binary sections instead of reading them
+    """
+    def _read(self, path, **kwargs):
+        return spice.SpiceReader(path, use_index=False, **kwargs).get_plots()
+
+    def _check_plots(self, path, mmap):
+        expected = self._read(path, mmap=False)
+        plots = self._read(path, mmap=mmap)
+        self.assertEqual(len(expected), len(plots))
+        for plot, values in zip(plots, expected):
+            vectors = [plot.get_scalevector()] + plot.get_datavectors()
+            for vector in vectors:
+                self.assertEqual(mmap, isinstance(vector.get_data(),
+                                                  numpy.memmap))
+            testing.assert_array_equal(get_values(plot), get_values(values))
+
+    def test_mmap(self):
+        for kwargs in ({}, {'double': True, 'little_endian': True},
+                       {'real': False}, {'nplots': 2}):
+            path = self.write_raw('test.raw', NPOINTS, NVARS, **kwargs)
+            self._check_plots(path, True)
+
+    def test_option(self):
+        self.flags(mmap=True)
+        path = self.write_raw('test.raw', NPOINTS, NVARS)
+        plot = spice.SpiceReader(path, use_index=False).get_plots()[0]
+        self.assertTrue(isinstance(plot.get_scalevector().get_data(),
+                                   numpy.memmap))
+
+    def test_compressed(self):
+        # Compressed files can't be mapped, they are read
+        path = self.write_raw('test.raw', NPOINTS, NVARS)
+        with open(path, 'rb') as raw_file:
+            with gzip.GzipFile(path + '.gz', 'wb') as gzip_file:
+                shutil.copyfileobj(raw_file, gzip_file)
+        plots = self._read(path + '.gz', mmap=True)
+        self.assertFalse(isinstance(plots[0].get_scalevector().get_data(),
+                                    numpy.memmap))
+        testing.assert_array_equal(get_values(plots[0]),
+                                   get_values(self._read(path)[0]))
+
+
+class TestVectorSelection(base.TestCase):
+    """
+    Load only the data vectors matching names or glob patterns
+    """
+    def _select(self, vectors, **kwargs):
+        """
+        returns the plot read with the vectors selected and the values of
+        the plot read whole
+        """
+        path = self.write_raw('test.raw', NPOINTS, NVARS, **kwargs)
+        plot = spice.SpiceReader(path, use_index=False,
+                                 vectors=vectors).get_plots()[0]
+        whole = spice.SpiceReader(path, use_index=False).get_plots()[0]
+        return plot, get_values(whole)
+
+    def test_formats(self):
+        for kwargs in ({}, {'binary': False}, {'real': False},
+                       {'binary': False, 'real': False}):
+            plot, values = self._select(['v(*)'], **kwargs)
+            self.assertEqual(['v(n1)', 'v(n3)'], plot.get_vector_names())
+            testing.assert_array_equal(get_values(plot), values[:, [0, 1, 3]])
+
+    def test_names(self):
+        plot, values = self._select(['i(v2)', 'v(n3)'])
+        self.assertEqual(['i(v2)', 'v(n3)'], plot.get_vector_names())
+        testing.assert_array_equal(get_values(plot), values[:, [0, 2, 3]])
+
+    def test_no_match(self):
+        plot, values = self._select(['x(*)'])
+        self.assertEqual([], plot.get_vector_names())
+        testing.assert_array_equal(plot.get_scalevector().get_data(),
+                                   values[:, 0])
+
+    def test_option(self):
+        self.flags(vectors=['i(*)'])
+        plot = spice.SpiceReader(self.write_raw('test.raw', NPOINTS, NVARS),
+                                 use_index=False).get_plots()[0]
+        self.assertEqual(['i(v2)'], plot.get_vector_names())
+
+    def test_iter_chunks(self):
+        for kwargs in ({}, {'binary': False}, {'real': False}):
+            path = self.write_raw('test.raw', NPOINTS, NVARS, **kwargs)
+            reader = spice.SpiceReader(path, load=False, use_index=False,
+                                       vectors=['v(*)'])
+            whole = spice.SpiceReader(path, use_index=False).get_plots()[0]
+            for plot in reader.scan():
+                blocks = list(reader.iter_chunks(plot, 128))
+                testing.assert_array_equal(numpy.concatenate(blocks),
+                                           get_values(whole)[:, [0, 1, 3]])
+
+
+class TestDimensions(base.TestCase):
+    """
+    Reshape the vectors of nested sweeps to their dimensions
+    """
+    def test_dimensions(self):
+        expected = rawgen.get_values(12, NVARS)[0]
+        for kwargs in ({}, {'binary': False, 'double': True},
+                       {'mmap': True}):
+            mmap = kwargs.pop('mmap', False)
+            path = self.write_raw('test.raw', 12, NVARS, dimensions=(3, 4),
+                                  **kwargs)
+            plot = spice.SpiceReader(path, mmap=mmap,
+                                     use_index=False).get_plots()[0]
+            self.assertEqual([3, 4], plot.dimensions)
+            vectors = [plot.get_scalevector()] + plot.get_datavectors()
+            for n, vector in enumerate(vectors):
+                # The last dimension varies the fastest
+                testing.assert_allclose(vector.get_data(),
+                                        expected[:, n].reshape(3, 4),
+                                        rtol=1e-7)
+
+
+class TestFollow(base.TestCase):
+    """
+    Follow a raw file with the point count of a running simulator
+    """
+    def setUp(self):
+        super(TestFollow, self).setUp()
+        # Following a file must never spin past its timeout
+        self.useFixture(fixtures.Timeout(10, gentle=True))
+
+    def _follow(self, truncate=0, nplots=1, **kwargs):
+        """
+        returns the points followed in the first plot of a raw file with
+        no point count, cut by truncate bytes
+        """
+        path = self.write_raw('test.raw', NPOINTS, NVARS, nplots=nplots,
+                              **kwargs)
+        with open(path, 'r+b') as raw_file:
+            content = raw_file.read()
+            raw_file.seek(content.index('No. Points: %d' % NPOINTS))
+            raw_file.write('No. Points: 0  ')
+            raw_file.truncate(len(content) - truncate)
+        reader = spice.SpiceReader(path, load=False, use_index=False)
+        blocks = [block for plot, block in
+                  reader.follow(poll_interval=0.01, timeout=0.5)]
+        return numpy.concatenate(blocks)
+
+    def test_follow(self):
+        for double in (False, True):
+            for little_endian in (False, True):
+                data_type = rawgen.get_data_type(double, little_endian)
+                expected = rawgen.get_values(NPOINTS, NVARS)[0]
+                testing.assert_array_equal(
+                    self._follow(double=double, little_endian=little_endian),
+                    expected.astype(data_type))
+
+    def test_partial_point(self):
+        expected = rawgen.get_values(NPOINTS, NVARS)[0][:-1]
+        testing.assert_array_equal(self._follow(truncate=5),
+                                   expected.astype(numpy.float32))
+        testing.assert_allclose(self._follow(truncate=5, binary=False,
+                                             double=True),
+                                expected, rtol=1e-14)
+
+    def test_next_plot(self):
+        expected = rawgen.get_values(NPOINTS, NVARS)[0]
+        # The headers of the next plot end an ASCII section
+        testing.assert_allclose(self._follow(nplots=2, binary=False,
+                                             double=True),
+                                expected, rtol=1e-14)
+        # Without a point count they are read as points of a binary one
+        values = self._follow(nplots=2)
+        testing.assert_array_equal(values[:NPOINTS],
+                                   expected.astype(numpy.float32))
+
+
+class TestDetection(base.TestCase):
+    """
+    Detect the byte order and precision of the binary sections
+    """
+    def _detect(self, double, little_endian, reader_args=None,
+                compress=False):
+        """
+        returns the dtype read of a file written with the given precision
+        and byte order
+        """
+        path = self.write_raw('test.raw', NPOINTS, NVARS, nplots=2,
+                              double=double, little_endian=little_endian)
+        if compress:
+            with open(path, 'rb') as raw_file:
+                with gzip.GzipFile(path + '.gz', 'wb') as gzip_file:
+                    shutil.copyfileobj(raw_file, gzip_file)
+            path += '.gz'
+        reader = spice.SpiceReader(path, use_index=False,
+                                   **(reader_args or {}))
+        return reader.data_type
+
+    def test_detect(self):
+        for double in (False, True):
+            for little_endian in (False, True):
+                data_type = self._detect(double, little_endian)
+                self.assertEqual(rawgen.get_data_type(double, little_endian),
+                                 data_type)
+
+    def test_detect_compressed(self):
+        for double in (False, True):
+            for little_endian in (False, True):
+                data_type = self._detect(double, little_endian,
+                                         compress=True)
+                self.assertEqual(rawgen.get_data_type(double, little_endian),
+                                 data_type)
+
+    def test_overrides(self):
+        reader_args = {'little_endian': True, 'double_precision': False}
+        data_type = self._detect(False, False, reader_args)
+        self.assertEqual(numpy.dtype('<f4'), data_type)
+
+    def test_options(self):
+        self.flags(little_endian=True, double_precision=True)
+        data_type = self._detect(True, True)
+        self.assertEqual(numpy.dtype('<f8'), data_type)
+
+
+class TestIndex(base.TestCase):
+    """
+    Scan raw files through their sidecar index
+    """
+    def _scan(self, path, **kwargs):
+        reader = spice.SpiceReader(path, load=False, use_index=True,
+                                   **kwargs)
+        return [plot.section.data_type for plot in reader.scan()]
+
+    def test_index(self):
+        path = self.write_raw('test.raw', NPOINTS, NVARS, nplots=2,
+                              double=True, little_endian=True)
+        self.assertEqual([numpy.dtype('<f8')] * 2, self._scan(path))
+        self.assertTrue(os.path.exists(path + spice.INDEX_SUFFIX))
+        self.assertEqual([numpy.dtype('<f8')] * 2, self._scan(path))
+
+    def test_overrides(self):
+        path = self.write_raw('test.raw', NPOINTS, NVARS, double=True,
+                              little_endian=True)
+        self._scan(path)
+        self.assertEqual([numpy.dtype('>f8')],
+                         self._scan(path, little_endian=False))
+        self.assertEqual([numpy.dtype('<f8')], self._scan(path))
+
+    def test_guess(self):
+        path = self.write_raw('test.raw', NPOINTS, NVARS)
+        # Zeros decode the same in either byte order
+        with open(path, 'r+b') as raw_file:
+            offset = raw_file.read().index('Binary:\n') + len('Binary:\n')
+            raw_file.seek(offset)
+            raw_file.write('\0' * (NPOINTS * NVARS * 4))
+        self._scan(path)
+        self.assertFalse(os.path.exists(path + spice.INDEX_SUFFIX))
+
+
+class TestLTSpiceReader(base.TestCase):
+    """
+    Read the utf-16 binary files written by LTspice
+    """
+    def _write_ltspice(self, double=False):
+        """
+        Write an LTspice raw file, with the time flagged in its sign bit
+        every other point, and return its path and records
+        """
+        header = (u"Title: * test.asc\n"
+                  u"Date: Thu Jan  1 00:00:00 2015\n"
+                  u"Plotname: Transient Analysis\n"
+                  u"Flags: real forward%s\n"
+                  u"No. Variables: %d\n"
+                  u"No. Points: %d\n"
+                  u"Offset:   0.0000000000000000e+000\n"
+                  u"Command: Linear Technology Corporation LTspice XVII\n"
+                  u"Variables:\n"
+                  u"\t0\ttime\ttime\n" %
+                  (" double" if double else "", NVARS, NPOINTS))
+        for n in xrange(1, NVARS):
+            header += u"\t%d\tV(n%d)\tvoltage\n" % (n, n)
+        header += u"Binary:\n"
+        data_type = [('f0', '<f8')] + [('f%d' % n, '<f8' if double else '<f4')
+                                       for n in xrange(1, NVARS)]
+        records = numpy.zeros(NPOINTS, dtype=data_type)
+        values = rawgen.get_values(NPOINTS, NVARS)[0]
+        for n in xrange(NVARS):
+            records['f%d' % n] = values[:, n]
+        records['f0'][1::2] *= -1
+        path = self.get_path('test.raw')
+        with open(path, 'wb') as raw_file:
+            raw_file.write(header.encode('utf-16-le'))
+            raw_file.write(records.tostring())
+        return path, records
+
+    def _check_values(self, values, records):
+        testing.assert_array_equal(values[:, 0], numpy.abs(records['f0']))
+        for n in xrange(1, NVARS):
+            testing.assert_array_equal(values[:, n], records['f%d' % n])
+
+    def test_records(self):
+        path, records = self._write_ltspice()
+        reader = spice.get_reader(path, use_index=False)
+        self.assertTrue(isinstance(reader, spice.LTSpiceReader))
+        plot = reader.get_plots()[0]
+        self.assertEqual(records.dtype, plot.section.data_type)
+        self.assertEqual(['V(n1)', 'V(n2)', 'V(n3)'],
+                         plot.get_vector_names())
+        self._check_values(get_values(plot), records)
+
+    def test_double(self):
+        path, records = self._write_ltspice(double=True)
+        reader = spice.get_reader(path, use_index=False)
+        plot = reader.get_plots()[0]
+        self.assertEqual(numpy.dtype('<f8'), plot.section.data_type)
+        self._check_values(get_values(plot), records)
+
+    def test_iter_chunks(self):
+        path, records = self._write_ltspice()
+        reader = spice.get_reader(path, load=False, use_index=False)
+        for plot in reader.scan():
+            blocks = list(reader.iter_chunks(plot, 128))
+            self.assertEqual(4, len(blocks))
+            for block in blocks:
+                # The float32 columns are widened to the scale
+                self.assertEqual(numpy.dtype(numpy.float64), block.dtype)
+                self.assertEqual(NVARS, block.shape[1])
+            self._check_values(numpy.concatenate(blocks), records)
+
+
+class TestGetReader(base.TestCase):
+    def _get_reader(self, old, new):
+        path = self.write_raw('test.raw', NPOINTS, NVARS)
+        with open(path, 'rb') as raw_file:
+            content = raw_file.read().replace(old, new, 1)
+        with open(path, 'wb') as raw_file:
+            raw_file.write(content)
+        return spice.get_reader(path, load=False)
+
+    def test_title(self):
+        reader = self._get_reader('Title: powerpyspice',
+                                  'Title: LTspice model of')
+        self.assertFalse(isinstance(reader, spice.LTSpiceReader))
+
+    def test_command(self):
+        reader = self._get_reader(
+            '\nVariables:', '\nCommand: Linear Technology Corporation'
+            ' LTspice XVII\nVariables:')
+        self.assertTrue(isinstance(reader, spice.LTSpiceReader))
+
+    def test_ngspice_command(self):
+        reader = self._get_reader('\nVariables:',
+                                  '\nCommand: version 30\nVariables:')
+        self.assertFalse(isinstance(reader, spice.LTSpiceReader))
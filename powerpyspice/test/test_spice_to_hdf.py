@@ -0,0 +1,132 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+import numpy
+from numpy import testing
+
+from powerpyspice.benchmark import rawgen
+from powerpyspice import exceptions
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import reader
+from powerpyspice.hdf import spice_to_hdf
+from powerpyspice.test import base
+
+NPOINTS = 500
+NVARS = 4
+NPLOTS = 2
+
+
+class TestHdfCreate(base.TestCase):
+    """
+    Convert raw files of several plots of the same name, into new and
+    existing files
+    """
+    def setUp(self):
+        super(TestHdfCreate, self).setUp()
+        self.raw = self.write_raw('test.raw', NPOINTS, NVARS, nplots=NPLOTS)
+        self.path = self.get_path('test.h5')
+
+    def _check_file(self, seed=0):
+        h5file = backend.open_file(self.path)
+        self.addCleanup(h5file.close)
+        groups = sorted(h5file.values(), key=lambda group: group.attrs['id'])
+        self.assertEqual(['/Transient Analysis', '/Transient Analysis-1'],
+                         [group.name for group in groups])
+        expected = rawgen.get_values(NPOINTS, NVARS, nplots=NPLOTS,
+                                     seed=seed)
+        for group, values in zip(groups, expected):
+            plot = reader.HdfPlot(group)
+            values = values.astype(numpy.float32)
+            testing.assert_array_equal(plot.get_scale(), values[:, 0])
+            testing.assert_array_equal(plot.get_vector('v(n1)'),
+                                       values[:, 1])
+
+    def test_plot_names(self):
+        spice_to_hdf.HdfCreate(self.raw, self.path)
+        self._check_file()
+
+    def test_plot_names_overwrite(self):
+        # The plots of the session are not replaced by the next ones
+        self.flags(overwrite=True)
+        spice_to_hdf.HdfCreate(self.raw, self.path)
+        self._check_file()
+
+    def test_plot_exists(self):
+        spice_to_hdf.HdfCreate(self.raw, self.path)
+        self.assertRaises(exceptions.PlotExists, spice_to_hdf.HdfCreate,
+                          self.raw, self.path)
+        self._check_file()
+
+    def test_overwrite(self):
+        spice_to_hdf.HdfCreate(self.raw, self.path)
+        raw = self.write_raw('other.raw', NPOINTS, NVARS, nplots=NPLOTS,
+                             seed=1)
+        self.flags(overwrite=True)
+        spice_to_hdf.HdfCreate(raw, self.path)
+        self._check_file(seed=1)
+
+
+class TestIterPipelined(base.TestCase):
+    """
+    Produce items ahead in a thread
+    """
+    def setUp(self):
+        super(TestIterPipelined, self).setUp()
+        self.produced = []
+        self.closed = threading.Event()
+        self.threads = threading.active_count()
+
+    def _produce(self, count=None, error=None):
+        """
+        Yield count numbers, forever by default, then raise error if set
+        """
+        try:
+            n = 0
+            while count is None or n < count:
+                self.produced.append(n)
+                yield n
+                n += 1
+            if error is not None:
+                raise error
+        finally:
+            self.closed.set()
+
+    def test_items(self):
+        for depth in (0, 1, 4):
+            self.assertEqual(range(100), list(spice_to_hdf.iter_pipelined(
+                self._produce(100), depth)))
+
+    def test_producer_error(self):
+        items = spice_to_hdf.iter_pipelined(
+            self._produce(10, ValueError('producer failed')), 4)
+        self.assertEqual(range(10), [items.next() for n in xrange(10)])
+        error = self.assertRaises(ValueError, items.next)
+        self.assertEqual('producer failed', str(error))
+        self.assertTrue(self.closed.is_set())
+        self.assertEqual(self.threads, threading.active_count())
+
+    def test_consumer_stops(self):
+        depth = 4
+        items = spice_to_hdf.iter_pipelined(self._produce(), depth)
+        for n, item in enumerate(items):
+            if n == 10:
+                break
+        # The producer is stopped and its generator closed before close()
+        # returns, with at most the queue and the item being put ahead
+        items.close()
+        self.assertTrue(self.closed.is_set())
+        self.assertEqual(self.threads, threading.active_count())
+        self.assertTrue(len(self.produced) <= 11 + depth + 1)
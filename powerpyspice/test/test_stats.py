@@ -0,0 +1,133 @@
+# Copyright 2013 Matthew Treinish
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import StringIO
+
+import fixtures
+import numpy
+from numpy import testing
+
+from powerpyspice.benchmark import rawgen
+from powerpyspice.cmd import powerstats
+from powerpyspice.hdf import backend
+from powerpyspice.hdf import reader
+from powerpyspice.hdf import spice_to_hdf
+from powerpyspice.hdf import stats
+from powerpyspice.test import base
+
+NPOINTS = 1000
+NVARS = 4
+NAMES = ['v(n1)', 'i(v2)', 'v(n3)']
+
+
+def get_expected(values):
+    """
+    returns the statistics of the data vectors of values computed by numpy
+    over all the points at once
+    """
+    scale = values[:, 0]
+    data = values[:, 1:]
+    span = scale[-1] - scale[0]
+    return {'min': data.min(axis=0),
+            'max': data.max(axis=0),
+            'argmin': scale[data.argmin(axis=0)],
+            'argmax': scale[data.argmax(axis=0)],
+            'mean': data.mean(axis=0),
+            'rms': numpy.sqrt(numpy.mean(numpy.square(data), axis=0)),
+            'average': numpy.trapz(data, scale, axis=0) / span}
+
+
+class TestStatsBuilder(base.TestCase):
+    def setUp(self):
+        super(TestStatsBuilder, self).setUp()
+        self.values = rawgen.get_values(NPOINTS, NVARS)[0]
+
+    def _build(self, sizes, values=None, time_weighted=True):
+        if values is None:
+            values = self.values
+        builder = stats.StatsBuilder(NAMES, time_weighted)
+        for block in numpy.split(values, numpy.cumsum(sizes)[:-1]):
+            builder.add_block(block)
+        return builder.get_table()
+
+    def _check_table(self, table, expected):
+        self.assertEqual(NAMES, list(table['name']))
+        for stat in ('min', 'max', 'argmin', 'argmax'):
+            testing.assert_array_equal(table[stat], expected[stat])
+        for stat in ('mean', 'rms', 'average'):
+            testing.assert_allclose(table[stat], expected[stat], rtol=1e-9)
+
+    def test_blocks(self):
+        expected = get_expected(self.values)
+        # Every boundary splits the integral between two blocks, the
+        # single point block is a segment on both sides
+        for sizes in ([NPOINTS], [500, 500], [100, 1, 399, 500]):
+            self._check_table(self._build(sizes), expected)
+
+    def test_not_time_weighted(self):
+        table = self._build([500, 500], time_weighted=False)
+        self.assertTrue(numpy.isnan(table['average']).all())
+        testing.assert_allclose(table['mean'],
+                                get_expected(self.values)['mean'],
+                                rtol=1e-9)
+
+    def test_one_point(self):
+        table = self._build([1], self.values[:1])
+        testing.assert_array_equal(table['average'], self.values[0, 1:])
+
+    def test_empty(self):
+        table = stats.StatsBuilder(NAMES).get_table()
+        for stat in stats.STATS:
+            self.assertTrue(numpy.isnan(table[stat]).all())
+
+    def test_complex(self):
+        values = rawgen.get_values(NPOINTS, NVARS, real=False)[0]
+        self._check_table(self._build([300, 700], values),
+                          get_expected(values.real))
+
+
+class TestPowerStats(base.TestCase):
+    """
+    Read the stats tables of converted plots
+    """
+    def setUp(self):
+        super(TestPowerStats, self).setUp()
+        raw = self.write_raw('test.raw', NPOINTS, NVARS)
+        self.flags(hdf_stats=True, hdf_chunk_points=256)
+        path = self.get_path('test.h5')
+        spice_to_hdf.HdfCreate(raw, path)
+        self.h5file = backend.open_file(path)
+        self.addCleanup(self.h5file.close)
+
+    def test_get_stats(self):
+        plot = reader.HdfPlot(self.h5file['Transient Analysis'])
+        self.assertTrue(plot.has_stats())
+        values = rawgen.get_values(NPOINTS, NVARS)[0]
+        expected = get_expected(values.astype(numpy.float32)
+                                .astype(numpy.float64))
+        for n, name in enumerate(NAMES):
+            row = plot.get_stats(name)
+            for stat in stats.STATS:
+                testing.assert_allclose(row[stat], expected[stat][n],
+                                        rtol=1e-9)
+
+    def test_print_stats(self):
+        stdout = StringIO.StringIO()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', stdout))
+        powerstats.print_stats(self.h5file, vectors=['v(*)'])
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual('Transient Analysis (Transient Analysis)', lines[0])
+        self.assertEqual(stats.STATS, tuple(lines[1].split()[1:]))
+        self.assertEqual(['v(n1)', 'v(n3)'],
+                         [line.split()[0] for line in lines[2:] if line])